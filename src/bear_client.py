@@ -1,5 +1,9 @@
+import functools
+import re
 import sqlite3
 import subprocess
+import threading
+import time
 import urllib.parse
 import logging
 from typing import Optional, Dict, Any, List
@@ -9,6 +13,154 @@ import os
 
 logger = logging.getLogger(__name__)
 
+# read_note results are reused for this many seconds
+_NOTE_TTL = 2.0
+# Maximum number of cached read_note results
+_NOTE_CACHE_SIZE = 128
+# Delays (seconds) between lookups for a newly created backup note
+_BACKUP_POLL_DELAYS = (0.02, 0.04, 0.08, 0.16, 0.32, 0.64)
+
+# Markdown heading line: starts with '#' once surrounding whitespace is
+# stripped, so indented headings count too
+_HEADING_RE = re.compile(r'^[^\S\n]*#[^\n]*', re.M)
+
+# Queries against Bear's database. They are fixed strings (never f-strings)
+# so sqlite3's per-connection statement cache reuses the prepared form.
+
+# Whether ZTEXT already starts with the "# Title" line
+_HAS_TITLE_PREFIX = "SUBSTR(ZTEXT, 1, LENGTH(ZTITLE) + 2) = ('# ' || ZTITLE)"
+
+# read_note lookups; both select the same columns and differ only in the key
+_READ_NOTE_COLUMNS = """
+    SELECT ZUNIQUEIDENTIFIER, ZTITLE, ZTEXT, ZTRASHED, ZMODIFICATIONDATE, ZCREATIONDATE,
+           """ + _HAS_TITLE_PREFIX + """ AS has_title_prefix
+    FROM ZSFNOTE
+"""
+_READ_BY_PK = _READ_NOTE_COLUMNS + "WHERE Z_PK = ? AND (ZTRASHED = 0 OR ZTRASHED IS NULL)"
+_READ_BY_UUID = _READ_NOTE_COLUMNS + "WHERE ZUNIQUEIDENTIFIER = ? AND (ZTRASHED = 0 OR ZTRASHED IS NULL)"
+
+_UUID_FOR_PK = """
+    SELECT ZUNIQUEIDENTIFIER
+    FROM ZSFNOTE
+    WHERE Z_PK = ?
+    AND (ZTRASHED = 0 OR ZTRASHED IS NULL)
+"""
+
+# Only the preview is needed; one extra character shows whether it was cut off
+_SEARCH_NOTES = """
+    SELECT ZUNIQUEIDENTIFIER, ZTITLE, SUBSTR(ZTEXT, 1, 101)
+    FROM ZSFNOTE
+    WHERE (ZTITLE LIKE ? OR ZTEXT LIKE ?)
+    AND (ZTRASHED = 0 OR ZTRASHED IS NULL)
+    LIMIT 10
+"""
+# Same search returning whole note bodies, for callers about to read them
+_SEARCH_NOTES_WITH_CONTENT = """
+    SELECT ZUNIQUEIDENTIFIER, ZTITLE, ZTEXT, """ + _HAS_TITLE_PREFIX + """
+    FROM ZSFNOTE
+    WHERE (ZTITLE LIKE ? OR ZTEXT LIKE ?)
+    AND (ZTRASHED = 0 OR ZTRASHED IS NULL)
+    LIMIT 10
+"""
+
+_LATEST_BY_TITLE = """
+    SELECT ZUNIQUEIDENTIFIER
+    FROM ZSFNOTE
+    WHERE ZTITLE = ?
+    ORDER BY ZCREATIONDATE DESC
+    LIMIT 1
+"""
+
+
+def insert_line(content: str, line_number: int, new_line: str) -> str:
+    """Insert new_line so it becomes line line_number (1-based) of content.
+
+    Out-of-range line numbers clamp to the start or end. Works on string
+    offsets so large notes aren't split into a list of lines.
+    """
+    line_index = max(0, line_number - 1)
+    if line_index == 0:
+        return new_line + '\n' + content
+    
+    pos = -1
+    for _ in range(line_index):
+        pos = content.find('\n', pos + 1)
+        if pos < 0:
+            return content + '\n' + new_line
+    return content[:pos] + '\n' + new_line + content[pos:]
+
+
+def replace_section_content(
+    content: str,
+    section_heading: str,
+    new_section: str,
+    first_match: bool = False
+) -> Optional[str]:
+    """Replace the body of the heading containing section_heading.
+
+    The section runs until the next heading of the same or a higher level.
+    By default a later matching heading inside the open section takes over
+    as the target (BearClient.replace_section's rule). With first_match,
+    the first heading line containing section_heading is used and the
+    section is never re-anchored (the MCP preview's rule).
+    Returns the updated content, or None if no matching heading exists.
+    """
+    # A heading is a single line, so it can never contain a newline
+    if '\n' in section_heading:
+        return None
+    
+    # Walk only the heading lines; body lines are skipped by the regex
+    section_start = heading_level = None
+    for match in _HEADING_RE.finditer(content):
+        heading = match.group(0)
+        # Levels count hashes from column 0, so an indented heading is level 0
+        level = len(heading) - len(heading.lstrip('#'))
+        if first_match:
+            is_target = section_start is None and section_heading in heading
+        else:
+            is_target = section_heading in heading.strip()
+        if is_target:
+            section_start, heading_level = match.end(), level
+        elif section_start is not None and level <= heading_level:
+            return content[:section_start] + '\n' + new_section + '\n' + content[match.start():]
+    
+    if section_start is None:
+        return None
+    return content[:section_start] + '\n' + new_section
+
+
+def _full_content(title: Optional[str], content: Optional[str], has_title_prefix: bool) -> str:
+    """Bear stores content with the title as its first line; prepend the
+    title when ZTEXT doesn't start with it."""
+    if title and content and not has_title_prefix:
+        return f"# {title}\n{content}"
+    return content or ""
+
+
+@functools.lru_cache(maxsize=1)
+def _launch_services():
+    """Return an in-process URL opener backed by LaunchServices, or None.
+
+    Requires PyObjC; without it URLs are opened through the `open` command.
+    """
+    try:
+        from CoreFoundation import CFURLCreateWithString
+        from LaunchServices import LSOpenCFURLRef
+    except ImportError:
+        return None
+
+    def open_url(url: str) -> bool:
+        cf_url = CFURLCreateWithString(None, url, None)
+        if cf_url is None:
+            return False
+        status = LSOpenCFURLRef(cf_url, None)
+        # PyObjC returns (status, launched_url) for the output parameter
+        if isinstance(status, tuple):
+            status = status[0]
+        return status == 0
+
+    return open_url
+
 
 class BearClient:
     """Client for interacting with Bear app via SQLite database and x-callback-url."""
@@ -21,9 +173,49 @@ class BearClient:
         
         if not self.db_path.exists():
             logger.warning(f"Bear database not found at {self.db_path}")
+        
+        # Long-lived read-only connection, opened lazily on first query
+        self._ro_conn: Optional[sqlite3.Connection] = None
+        self._ro_lock = threading.Lock()
+        
+        # Short-lived cache of read_note results: note_id -> (timestamp, note)
+        self._note_cache: Dict[str, tuple[float, Dict[str, Any]]] = {}
+        self._cache_lock = threading.Lock()
+        
+        # Z_PK -> ZUNIQUEIDENTIFIER; the pair never changes for a note
+        self._pk_uuid: Dict[int, str] = {}
+    
+    def _get_ro_conn(self) -> sqlite3.Connection:
+        """Return the shared read-only connection to Bear's database, opening it on first use."""
+        with self._ro_lock:
+            if self._ro_conn is None:
+                conn = sqlite3.connect(
+                    f"file:{self.db_path}?mode=ro&cache=shared",
+                    uri=True,
+                    check_same_thread=False
+                )
+                conn.execute("PRAGMA query_only=1")
+                conn.execute("PRAGMA cache_size=-20000")
+                conn.execute("PRAGMA mmap_size=268435456")
+                self._ro_conn = conn
+            return self._ro_conn
+    
+    def close(self):
+        """Close the shared read-only connection."""
+        with self._ro_lock:
+            if self._ro_conn is not None:
+                self._ro_conn.close()
+                self._ro_conn = None
     
     def _execute_url(self, url: str) -> bool:
         """Execute a Bear x-callback-url."""
+        open_url = _launch_services()
+        if open_url is not None:
+            try:
+                return open_url(url)
+            except Exception as e:
+                logger.error(f"LaunchServices failed to open Bear URL, falling back to open: {e}")
+        
         try:
             # Use open command to execute the URL
             result = subprocess.run(
@@ -49,46 +241,27 @@ class BearClient:
             logger.error("Bear database not found")
             return None
         
+        cached = self._note_cache.get(note_id)
+        if cached and time.monotonic() - cached[0] < _NOTE_TTL:
+            return dict(cached[1])
+        
         try:
-            # Connect to Bear's database in read-only mode
-            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
-            cursor = conn.cursor()
+            cursor = self._get_ro_conn().cursor()
             
-            # Determine if we're searching by Z_PK (numeric) or ZUNIQUEIDENTIFIER (UUID)
+            # Numeric IDs are Z_PK values, anything else is a ZUNIQUEIDENTIFIER
             if note_id.isdigit():
-                # Numeric ID - search by Z_PK
-                query = """
-                    SELECT ZUNIQUEIDENTIFIER, ZTITLE, ZTEXT, ZTRASHED, ZMODIFICATIONDATE, ZCREATIONDATE
-                    FROM ZSFNOTE
-                    WHERE Z_PK = ?
-                    AND (ZTRASHED = 0 OR ZTRASHED IS NULL)
-                """
-                cursor.execute(query, (int(note_id),))
+                cursor.execute(_READ_BY_PK, (int(note_id),))
             else:
-                # UUID format - search by ZUNIQUEIDENTIFIER
-                query = """
-                    SELECT ZUNIQUEIDENTIFIER, ZTITLE, ZTEXT, ZTRASHED, ZMODIFICATIONDATE, ZCREATIONDATE
-                    FROM ZSFNOTE
-                    WHERE ZUNIQUEIDENTIFIER = ?
-                    AND (ZTRASHED = 0 OR ZTRASHED IS NULL)
-                """
-                cursor.execute(query, (note_id,))
+                cursor.execute(_READ_BY_UUID, (note_id,))
             result = cursor.fetchone()
             
             if result:
-                # Both queries return the same fields in the same order
-                uuid, title, content, trashed, mod_date, create_date = result
+                uuid, title, content, trashed, mod_date, create_date, has_title_prefix = result
+                full_content = _full_content(title, content, has_title_prefix)
                 
-                # Bear stores content with title as first line
-                # If content doesn't start with title, prepend it
-                if title and content and not content.startswith(f"# {title}"):
-                    full_content = f"# {title}\n{content}"
-                else:
-                    full_content = content or ""
+                cursor.close()
                 
-                conn.close()
-                
-                return {
+                note = {
                     "id": uuid,  # Always return the UUID, not the Z_PK
                     "content": full_content,
                     "title": title or self._extract_title(full_content),
@@ -96,8 +269,10 @@ class BearClient:
                     "modification_date": mod_date,
                     "creation_date": create_date
                 }
+                self._cache_note(note_id, note)
+                return dict(note)
             
-            conn.close()
+            cursor.close()
             logger.error(f"Note not found with ID: {note_id}")
             
         except sqlite3.Error as e:
@@ -107,38 +282,70 @@ class BearClient:
         
         return None
     
-    def search_notes(self, search_term: str) -> List[Dict[str, Any]]:
-        """Search for notes by title or content."""
+    def _cache_note(self, note_id: str, note: Dict[str, Any]):
+        """Store a read_note result, evicting the oldest entry when full."""
+        with self._cache_lock:
+            self._note_cache.pop(note_id, None)
+            if len(self._note_cache) >= _NOTE_CACHE_SIZE:
+                self._note_cache.pop(next(iter(self._note_cache)))
+            self._note_cache[note_id] = (time.monotonic(), note)
+    
+    def _invalidate(self, note_id: str):
+        """Drop cached read_note results for a note, whichever ID form was used."""
+        with self._cache_lock:
+            for key, (_, note) in list(self._note_cache.items()):
+                if key == note_id or note["id"] == note_id:
+                    del self._note_cache[key]
+    
+    def _zpk_to_uuid(self, pk: int) -> Optional[str]:
+        """Translate a Z_PK into the note's ZUNIQUEIDENTIFIER."""
+        uuid = self._pk_uuid.get(pk)
+        if uuid:
+            return uuid
+        
+        try:
+            cursor = self._get_ro_conn().cursor()
+            cursor.execute(_UUID_FOR_PK, (pk,))
+            result = cursor.fetchone()
+            cursor.close()
+        except sqlite3.Error as e:
+            logger.error(f"Database error resolving note ID: {e}")
+            return None
+        
+        if result:
+            self._pk_uuid[pk] = result[0]
+            return result[0]
+        return None
+    
+    def search_notes(self, search_term: str, include_content: bool = False) -> List[Dict[str, Any]]:
+        """Search for notes by title or content.
+        With include_content, each result also carries the note's full
+        content (as read_note returns it), saving a read_note per result."""
         if not self.db_path.exists():
             logger.error("Bear database not found")
             return []
         
         try:
-            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
-            cursor = conn.cursor()
-            
-            query = """
-                SELECT ZUNIQUEIDENTIFIER, ZTITLE, ZTEXT
-                FROM ZSFNOTE
-                WHERE (ZTITLE LIKE ? OR ZTEXT LIKE ?)
-                AND (ZTRASHED = 0 OR ZTRASHED IS NULL)
-                LIMIT 10
-            """
+            cursor = self._get_ro_conn().cursor()
             
             search_pattern = f"%{search_term}%"
+            query = _SEARCH_NOTES_WITH_CONTENT if include_content else _SEARCH_NOTES
             cursor.execute(query, (search_pattern, search_pattern))
             results = cursor.fetchall()
             
             notes = []
             for row in results:
-                note_id, title, content = row
-                notes.append({
+                note_id, title, content = row[:3]
+                note = {
                     "id": note_id,
                     "title": title or "Untitled",
-                    "preview": (content or "")[:100] + "..." if content else ""
-                })
+                    "preview": content[:100] + "..." if content and len(content) > 100 else (content or "")
+                }
+                if include_content:
+                    note["content"] = _full_content(title, content, row[3])
+                notes.append(note)
             
-            conn.close()
+            cursor.close()
             return notes
             
         except sqlite3.Error as e:
@@ -152,35 +359,32 @@ class BearClient:
         # If we have a numeric ID (Z_PK), we need to get the UUID first
         actual_note_id = note_id
         if note_id.isdigit():
-            # Read the note to get its UUID
-            note_data = self.read_note(note_id)
-            if not note_data:
+            actual_note_id = self._zpk_to_uuid(int(note_id))
+            if not actual_note_id:
                 logger.error(f"Could not find note with Z_PK: {note_id}")
                 return False
-            actual_note_id = note_data["id"]  # This is the UUID
+        
+        # The note is about to change, so cached reads are stale
+        self._invalidate(note_id)
+        self._invalidate(actual_note_id)
         
         # For replace mode, we use add-text with mode=replace_all
         if mode == "replace":
             mode = "replace_all"
         
-        # Build the URL with proper encoding
-        # Note: We need to use quote() for the text content to avoid + signs
-        encoded_text = urllib.parse.quote(content, safe='')
-        
-        # Build parameters manually to control encoding
-        params = [
-            f"id={actual_note_id}",
-            f"text={encoded_text}",
-            f"mode={mode}",
-            "show_window=no",
-            "open_note=no"
-        ]
+        params = {
+            "id": actual_note_id,
+            "text": content,
+            "mode": mode,
+            "show_window": "no",
+            "open_note": "no"
+        }
         
         if mode == "append":
-            params.append("new_line=yes")
+            params["new_line"] = "yes"
         
-        # Build the URL
-        url = f"{self.base_url}/add-text?" + "&".join(params)
+        # Note: We need to use quote() for the text content to avoid + signs
+        url = f"{self.base_url}/add-text?" + urllib.parse.urlencode(params, quote_via=urllib.parse.quote)
         
         # Execute the update
         return self._execute_url(url)
@@ -190,51 +394,34 @@ class BearClient:
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         backup_title = f"[BACKUP] {original_title} - {timestamp}"
         
-        # Build the URL with proper encoding
-        encoded_title = urllib.parse.quote(backup_title, safe='')
-        encoded_text = urllib.parse.quote(original_content, safe='')
-        
-        # Build parameters manually to control encoding
-        params = [
-            f"title={encoded_title}",
-            f"text={encoded_text}",
-            "tags=mcp-backup",
-            "show_window=no",
-            "open_note=no"
-        ]
+        params = {
+            "title": backup_title,
+            "text": original_content,
+            "tags": "mcp-backup",
+            "show_window": "no",
+            "open_note": "no"
+        }
         
-        # Build the URL
-        url = f"{self.base_url}/create?" + "&".join(params)
+        url = f"{self.base_url}/create?" + urllib.parse.urlencode(params, quote_via=urllib.parse.quote)
         
         # Execute the creation
         if self._execute_url(url):
-            # Try to find the created note in the database
-            # Wait a moment for Bear to update the database
-            import time
-            time.sleep(0.5)
-            
+            # Bear writes the note asynchronously; poll with a growing delay
+            # so a fast save is picked up quickly and a slow one still is
             try:
-                conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
-                cursor = conn.cursor()
-                
-                # Find the most recently created note with our backup title
-                query = """
-                    SELECT ZUNIQUEIDENTIFIER
-                    FROM ZSFNOTE
-                    WHERE ZTITLE = ?
-                    ORDER BY ZCREATIONDATE DESC
-                    LIMIT 1
-                """
-                
-                cursor.execute(query, (backup_title,))
-                result = cursor.fetchone()
-                
-                if result:
-                    backup_id = result[0]
-                    conn.close()
-                    return backup_id
+                for delay in _BACKUP_POLL_DELAYS:
+                    time.sleep(delay)
+                    
+                    # Find the most recently created note with our backup title
+                    cursor = self._get_ro_conn().cursor()
+                    cursor.execute(_LATEST_BY_TITLE, (backup_title,))
+                    result = cursor.fetchone()
+                    cursor.close()
+                    
+                    if result:
+                        return result[0]
                 
-                conn.close()
+                logger.error(f"Backup note not found after creation: {backup_title}")
                 
             except sqlite3.Error as e:
                 logger.error(f"Error finding backup note: {e}")
@@ -243,14 +430,12 @@ class BearClient:
     
     def _extract_title(self, content: str) -> str:
         """Extract the title from note content (first line without # symbols)."""
-        lines = content.split('\n')
-        if lines:
-            title = lines[0].strip()
-            # Remove markdown heading symbols
-            while title.startswith('#'):
-                title = title[1:].strip()
-            return title if title else "Untitled"
-        return "Untitled"
+        # Only the first line is needed, so don't split the whole note
+        title = content.split('\n', 1)[0].strip()
+        # Remove markdown heading symbols
+        while title.startswith('#'):
+            title = title[1:].strip()
+        return title if title else "Untitled"
     
     def insert_at_line(self, note_id: str, content: str, line_number: int) -> bool:
         """Insert content at a specific line number."""
@@ -259,15 +444,7 @@ class BearClient:
         if not note_data:
             return False
         
-        # Split content into lines
-        lines = note_data["content"].split('\n')
-        
-        # Insert at the specified line (adjusting for 0-based indexing)
-        line_index = max(0, min(line_number - 1, len(lines)))
-        lines.insert(line_index, content)
-        
-        # Rejoin and update
-        new_content = '\n'.join(lines)
+        new_content = insert_line(note_data["content"], line_number, content)
         return self.update_note(note_id, new_content, mode="replace")
     
     def replace_section(self, note_id: str, section_heading: str, new_content: str) -> bool:
@@ -277,33 +454,8 @@ class BearClient:
         if not note_data:
             return False
         
-        lines = note_data["content"].split('\n')
-        
-        # Find the section
-        section_start = -1
-        section_end = len(lines)
-        heading_level = 0
-        
-        for i, line in enumerate(lines):
-            stripped = line.strip()
-            if section_heading in stripped and stripped.startswith('#'):
-                section_start = i
-                # Count the heading level
-                heading_level = len(line) - len(line.lstrip('#'))
-                continue
-            
-            if section_start >= 0 and i > section_start:
-                # Check if we've hit another section of same or higher level
-                if stripped.startswith('#'):
-                    current_level = len(line) - len(line.lstrip('#'))
-                    if current_level <= heading_level:
-                        section_end = i
-                        break
-        
-        if section_start >= 0:
-            # Replace the section content
-            new_lines = lines[:section_start+1] + [new_content] + lines[section_end:]
-            new_content = '\n'.join(new_lines)
-            return self.update_note(note_id, new_content, mode="replace")
+        new_content = replace_section_content(note_data["content"], section_heading, new_content)
+        if new_content is None:
+            return False
         
-        return False
\ No newline at end of file
+        return self.update_note(note_id, new_content, mode="replace")
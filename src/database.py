@@ -1,18 +1,173 @@
-import aiosqlite
+import asyncio
+import sqlite3
+import zstandard
 import uuid
-import json
 import os
 import stat
-from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Callable, Iterator, Tuple, TypeVar
 import logging
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 # Retention period for old records
 RETENTION_DAYS = 90
 
+# Number of read-only connections kept alongside the single writer
+READER_COUNT = 4
+
+# Number of previews and rollbacks kept in each in-process read cache
+RESULT_CACHE_SIZE = 512
+
+# Bumped whenever create_tables gains a migration step (stored in PRAGMA user_version)
+SCHEMA_VERSION = 5
+
+# Table definitions; {name} lets migrations build a replacement table.
+# "Now" is spelled strftime('%s', 'now') rather than unixepoch(), which
+# needs SQLite 3.38 and some Python builds bundle an older one.
+_PREVIEWS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        preview_id BLOB PRIMARY KEY,
+        note_id TEXT NOT NULL,
+        operation TEXT NOT NULL,
+        target TEXT,
+        original_content BLOB NOT NULL,
+        new_content BLOB NOT NULL,
+        status TEXT DEFAULT 'pending',
+        created_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+        expires_at INTEGER NOT NULL,
+        kind TEXT NOT NULL DEFAULT 'diff'
+    )
+'''
+
+_APPLIED_CHANGES_TABLE = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        rollback_id BLOB PRIMARY KEY,
+        preview_id BLOB NOT NULL,
+        note_id TEXT NOT NULL,
+        backup_note_id TEXT,
+        original_content BLOB NOT NULL,
+        applied_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+        note_title TEXT,
+        FOREIGN KEY (preview_id) REFERENCES previews(preview_id)
+    )
+'''
+
+# Note bodies are stored zstd-compressed
+_compressor = zstandard.ZstdCompressor(level=3)
+_decompressor = zstandard.ZstdDecompressor()
+
+# Per-connection tuning applied to the writer and every reader
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Statements used at runtime; sqlite3 caches the prepared form keyed by
+# the exact SQL text, so each one is defined once here and reused. Keep
+# them fixed strings: values go in as parameters, never via f-strings.
+_INSERT_PREVIEW_SQL = '''
+INSERT INTO previews
+(preview_id, note_id, operation, target, original_content, new_content, expires_at, kind)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+_SELECT_PREVIEW_SQL = '''
+SELECT preview_id, note_id, operation, target, original_content,
+       new_content, status, created_at, expires_at, kind
+FROM previews
+WHERE preview_id = ?
+'''
+# Same row plus whether a pending preview is past its expiry
+_SELECT_PREVIEW_EXPIRY_SQL = '''
+SELECT preview_id, note_id, operation, target, original_content,
+       new_content, status, created_at, expires_at, kind,
+       status = 'pending' AND expires_at < CAST(strftime('%s', 'now') AS INTEGER) AS expired
+FROM previews
+WHERE preview_id = ?
+'''
+_UPDATE_STATUS_SQL = '''
+UPDATE previews
+SET status = ?
+WHERE preview_id = ?
+RETURNING 1
+'''
+_INSERT_APPLIED_SQL = '''
+INSERT INTO applied_changes
+(rollback_id, preview_id, note_id, backup_note_id, original_content, note_title)
+VALUES (?, ?, ?, ?, ?, ?)
+'''
+_MARK_APPLIED_SQL = '''
+UPDATE previews
+SET status = 'applied'
+WHERE preview_id = ? AND status = 'pending'
+'''
+_SELECT_ROLLBACK_SQL = '''
+SELECT rollback_id, preview_id, note_id, backup_note_id,
+       original_content, applied_at
+FROM applied_changes
+WHERE rollback_id = ?
+'''
+_PREVIEW_STATUS_SQL = '''
+SELECT p.status, ac.rollback_id, ac.backup_note_id,
+       p.status = 'pending' AND p.expires_at < CAST(strftime('%s', 'now') AS INTEGER) AS expired
+FROM previews p
+LEFT JOIN applied_changes ac ON ac.preview_id = p.preview_id
+WHERE p.preview_id = ?
+'''
+_DELETE_EXPIRED_SQL = '''
+DELETE FROM previews
+WHERE expires_at < ? AND status = 'pending'
+'''
+_HAS_EXPIRED_SQL = '''
+SELECT 1 FROM previews
+WHERE status = 'pending' AND expires_at < ?
+LIMIT 1
+'''
+_DELETE_OLD_APPLIED_SQL = '''
+DELETE FROM applied_changes
+WHERE applied_at < ?
+'''
+_DELETE_OLD_PREVIEWS_SQL = '''
+DELETE FROM previews
+WHERE created_at < ?
+AND preview_id NOT IN (SELECT preview_id FROM applied_changes)
+'''
+_IS_EXPIRED_SQL = '''
+SELECT status = 'pending' AND expires_at < CAST(strftime('%s', 'now') AS INTEGER)
+FROM previews
+WHERE preview_id = ?
+'''
+_RECENT_PREVIEWS_SQL = '''
+SELECT preview_id, operation, status, created_at
+FROM previews
+WHERE note_id = ?
+ORDER BY created_at DESC
+LIMIT ?
+'''
+_APPLIED_HISTORY_SQL = '''
+SELECT
+    ac.rollback_id,
+    ac.preview_id,
+    ac.note_id,
+    ac.applied_at,
+    p.operation,
+    p.target,
+    ac.note_title
+FROM applied_changes ac
+JOIN previews p ON ac.preview_id = p.preview_id
+ORDER BY ac.applied_at DESC
+LIMIT ?
+'''
+
 
 def get_database_path() -> Path:
     """
@@ -28,23 +183,197 @@ def get_database_path() -> Path:
     return app_support / "bear_mcp.db"
 
 
+def _compress(text: str) -> bytes:
+    """Compress note content for storage."""
+    return _compressor.compress(text.encode("utf-8"))
+
+
+def _decompress(data) -> Optional[str]:
+    """Decompress stored note content.
+    Rows written before compression was introduced hold plain text."""
+    if data is None or isinstance(data, str):
+        return data
+    return _decompressor.decompress(data).decode("utf-8")
+
+
+def _content_title(text: Optional[str]) -> str:
+    """Title shown in the history view: the first line without heading marks."""
+    first_line = (text or "")[:200].split('\n', 1)[0]
+    return first_line.strip().lstrip('#').strip()
+
+
+@contextmanager
+def _transaction(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    """Run a block of statements as one write transaction."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _id_bytes(value: str) -> Optional[bytes]:
+    """Convert a preview/rollback ID from the API to its stored 16-byte form.
+    Returns None for malformed IDs, which then match no rows."""
+    try:
+        return uuid.UUID(value).bytes
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def _id_str(value: Optional[bytes]) -> Optional[str]:
+    """Convert a stored ID back to the dashed form used in URLs and responses."""
+    if value is None:
+        return None
+    return str(uuid.UUID(bytes=value))
+
+
+def _expired_cutoff() -> int:
+    """Expired previews are kept for a day before cleanup deletes them."""
+    return int(time.time()) - 24 * 60 * 60
+
+
+def _preview_from_row(row: sqlite3.Row) -> Dict[str, Any]:
+    """Decode a previews row into the dict returned to callers."""
+    preview = dict(row)
+    preview["preview_id"] = _id_str(row["preview_id"])
+    preview["original_content"] = _decompress(row["original_content"])
+    preview["new_content"] = _decompress(row["new_content"])
+    if row["kind"] == "append_delta":
+        preview["new_content"] = preview["original_content"] + preview["new_content"]
+    preview["created_at"] = _format_timestamp(row["created_at"])
+    preview["expires_at"] = _format_timestamp(row["expires_at"])
+    return preview
+
+
+def _format_timestamp(value: Optional[int]) -> Optional[str]:
+    """Format a stored Unix timestamp as local time for API responses."""
+    if value is None:
+        return None
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(value))
+
+
 class Database:
     """SQLite database for storing preview and rollback data."""
 
-    def __init__(self, db_path: Optional[str] = None):
+    def __init__(self, db_path: Optional[str] = None, readers: int = READER_COUNT):
         if db_path is None:
             db_path = get_database_path()
         self.db_path = str(db_path)
-        self.db = None
+        self.reader_count = readers
+        # One writer connection plus a queue of read-only connections.
+        # In WAL mode readers see a consistent snapshot while the writer commits.
+        self._writer: Optional[sqlite3.Connection] = None
+        self._readers: asyncio.Queue = asyncio.Queue()
+        self._all_readers: List[sqlite3.Connection] = []
+        # Blocking sqlite3 calls run on these threads. The writer pool has a
+        # single thread, so write transactions never interleave.
+        self._write_pool: Optional[ThreadPoolExecutor] = None
+        self._read_pool: Optional[ThreadPoolExecutor] = None
+        # LRU caches of decoded get_preview / get_rollback_data results.
+        # The generation is bumped on every invalidation so a read that
+        # raced a write doesn't store what it saw.
+        self._preview_cache: OrderedDict = OrderedDict()
+        self._rollback_cache: OrderedDict = OrderedDict()
+        self._cache_generation = 0
 
     async def connect(self):
         """Connect to the database and create tables if needed."""
-        self.db = await aiosqlite.connect(self.db_path)
+        loop = asyncio.get_running_loop()
+        self._write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._read_pool = ThreadPoolExecutor(
+            max_workers=self.reader_count, thread_name_prefix="db-reader"
+        )
+
+        self._writer = await loop.run_in_executor(self._write_pool, self._open)
+
+        # Retention cleanup is left to the server's background task so
+        # startup only pays for schema setup
         await self.create_tables()
+        # Enforced only after create_tables, whose migrations rebuild tables
+        await self._write(lambda db: db.execute("PRAGMA foreign_keys=ON"))
         # Set secure permissions on the database file (owner read/write only)
         self._set_secure_permissions()
-        await self.cleanup_expired()
-        await self.cleanup_old_records()
+
+        for _ in range(self.reader_count):
+            reader = await loop.run_in_executor(self._read_pool, self._open, True)
+            self._all_readers.append(reader)
+            self._readers.put_nowait(reader)
+
+    def pool_stats(self) -> Dict[str, int]:
+        """Report how many reader connections are busy, to spot exhaustion."""
+        idle = self._readers.qsize()
+        return {
+            "readers": len(self._all_readers),
+            "idle": idle,
+            "in_use": len(self._all_readers) - idle
+        }
+
+    async def journal_mode(self) -> str:
+        """Report the database's journal mode ('wal' once connected)."""
+        row = await self._read(lambda db: db.execute("PRAGMA journal_mode").fetchone())
+        return row[0]
+
+    def _open(self, read_only: bool = False) -> sqlite3.Connection:
+        """Open a connection with the shared PRAGMAs applied.
+
+        Connections are in autocommit mode; multi-statement writes use
+        _transaction explicitly.
+        """
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=128
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        if read_only:
+            conn.execute("PRAGMA query_only=1")
+        else:
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    async def _read(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        """Run fn on a read-only connection borrowed from the pool."""
+        conn = await self._readers.get()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._read_pool, fn, conn)
+        finally:
+            self._readers.put_nowait(conn)
+
+    async def _write(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        """Run fn on the writer connection."""
+        return await asyncio.get_running_loop().run_in_executor(self._write_pool, fn, self._writer)
+
+    def _cache_get(self, cache: OrderedDict, key: Optional[bytes]) -> Optional[Dict[str, Any]]:
+        """Return a copy of a cached result, marking it recently used."""
+        value = cache.get(key)
+        if value is None:
+            return None
+        cache.move_to_end(key)
+        return dict(value)
+
+    def _cache_put(self, cache: OrderedDict, key: Optional[bytes], value: Dict[str, Any], generation: int):
+        """Cache a result read at the given generation, evicting the oldest entry when full."""
+        if generation != self._cache_generation:
+            return
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > RESULT_CACHE_SIZE:
+            cache.popitem(last=False)
+
+    def _invalidate_caches(self, preview_key: Optional[bytes] = None):
+        """Drop one cached preview, or every cached result when no key is given."""
+        if preview_key is None:
+            self._preview_cache.clear()
+            self._rollback_cache.clear()
+        else:
+            self._preview_cache.pop(preview_key, None)
+        self._cache_generation += 1
 
     def _set_secure_permissions(self):
         """Set restrictive file permissions (600) on the database file."""
@@ -53,98 +382,258 @@ class Database:
             os.chmod(db_file, stat.S_IRUSR | stat.S_IWUSR)  # 600
 
     async def close(self):
-        """Close the database connection."""
-        if self.db:
-            await self.db.close()
+        """Close all database connections."""
+        loop = asyncio.get_running_loop()
+        # Wait for each reader to be returned before closing it
+        for _ in range(len(self._all_readers)):
+            reader = await self._readers.get()
+            await loop.run_in_executor(self._read_pool, reader.close)
+        self._all_readers.clear()
+        if self._writer:
+            # Let SQLite refresh planner statistics that have gone stale
+            # over this session, so the next one starts with them
+            await self._write(lambda db: db.execute("PRAGMA optimize"))
+            await self._write(sqlite3.Connection.close)
+            self._writer = None
+        for pool in (self._read_pool, self._write_pool):
+            if pool:
+                pool.shutdown()
+        self._read_pool = self._write_pool = None
 
     async def create_tables(self):
         """Create database tables if they don't exist."""
-        await self.db.execute('''
-            CREATE TABLE IF NOT EXISTS previews (
-                preview_id TEXT PRIMARY KEY,
-                note_id TEXT NOT NULL,
-                operation TEXT NOT NULL,
-                target TEXT,
-                original_content TEXT NOT NULL,
-                new_content TEXT NOT NULL,
-                status TEXT DEFAULT 'pending',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                expires_at TIMESTAMP NOT NULL
-            )
-        ''')
-
-        await self.db.execute('''
-            CREATE TABLE IF NOT EXISTS applied_changes (
-                rollback_id TEXT PRIMARY KEY,
-                preview_id TEXT NOT NULL,
-                note_id TEXT NOT NULL,
-                backup_note_id TEXT,
-                original_content TEXT NOT NULL,
-                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (preview_id) REFERENCES previews(preview_id)
+        def create(db: sqlite3.Connection):
+            with _transaction(db):
+                self._create_tables(db)
+
+        await self._write(create)
+
+    def _create_tables(self, db: sqlite3.Connection):
+        existing = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'previews'"
+        ).fetchone() is not None
+
+        db.execute(_PREVIEWS_TABLE.format(name="previews"))
+        db.execute(_APPLIED_CHANGES_TABLE.format(name="applied_changes"))
+
+        if existing:
+            self._migrate(db)
+        db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+        # Indexes for the history, status and cleanup queries
+        db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_previews_note_created "
+            "ON previews(note_id, created_at DESC)"
+        )
+        # Partial index: cleanup_expired only ever looks at pending previews
+        db.execute("DROP INDEX IF EXISTS idx_previews_expires_status")
+        db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_previews_pending_expires "
+            "ON previews(expires_at) WHERE status = 'pending'"
+        )
+        db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_applied_preview "
+            "ON applied_changes(preview_id)"
+        )
+        db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_applied_applied_at "
+            "ON applied_changes(applied_at DESC)"
+        )
+
+    def _migrate(self, db: sqlite3.Connection):
+        """Upgrade tables created by older versions to SCHEMA_VERSION."""
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+
+        if version < 1:
+            # Version 1: note content columns hold zstd-compressed BLOBs
+            for table, key, columns in (
+                ("previews", "preview_id", ("original_content", "new_content")),
+                ("applied_changes", "rollback_id", ("original_content",)),
+            ):
+                for column in columns:
+                    rows = db.execute(
+                        f"SELECT {key}, {column} FROM {table} WHERE typeof({column}) = 'text'"
+                    ).fetchall()
+                    db.executemany(
+                        f"UPDATE {table} SET {column} = ? WHERE {key} = ?",
+                        [(_compress(value), row_id) for row_id, value in rows]
+                    )
+
+        if version < 2:
+            # Version 2: timestamps are INTEGER Unix epoch seconds. Column
+            # defaults can't be altered in place, so rebuild both tables.
+            # Old created_at/applied_at were UTC, old expires_at local time.
+            db.execute(_PREVIEWS_TABLE.format(name="previews_new"))
+            db.execute('''
+                INSERT INTO previews_new
+                (preview_id, note_id, operation, target, original_content,
+                 new_content, status, created_at, expires_at)
+                SELECT preview_id, note_id, operation, target, original_content,
+                       new_content, status,
+                       CAST(strftime('%s', created_at) AS INTEGER),
+                       CAST(strftime('%s', expires_at, 'utc') AS INTEGER)
+                FROM previews
+            ''')
+            db.execute(_APPLIED_CHANGES_TABLE.format(name="applied_changes_new"))
+            db.execute('''
+                INSERT INTO applied_changes_new
+                (rollback_id, preview_id, note_id, backup_note_id, original_content, applied_at)
+                SELECT rollback_id, preview_id, note_id, backup_note_id, original_content,
+                       CAST(strftime('%s', applied_at) AS INTEGER)
+                FROM applied_changes
+            ''')
+            db.execute("DROP TABLE applied_changes")
+            db.execute("DROP TABLE previews")
+            db.execute("ALTER TABLE previews_new RENAME TO previews")
+            db.execute("ALTER TABLE applied_changes_new RENAME TO applied_changes")
+        elif version < 3:
+            db.execute("ALTER TABLE applied_changes ADD COLUMN note_title TEXT")
+
+        if version < 3:
+            # Version 3: history titles are stored at apply time rather than
+            # decompressed from original_content on every history request
+            rows = db.execute(
+                "SELECT rollback_id, original_content FROM applied_changes"
+            ).fetchall()
+            db.executemany(
+                "UPDATE applied_changes SET note_title = ? WHERE rollback_id = ?",
+                [(_content_title(_decompress(content)), row_id) for row_id, content in rows]
             )
-        ''')
 
-        await self.db.commit()
+        if version < 4:
+            # Version 4: IDs are stored as 16-byte UUID BLOBs instead of
+            # 36-character strings. Foreign keys aren't enforced yet here.
+            db.create_function("uuid_blob", 1, _id_bytes, deterministic=True)
+            for table, column in (
+                ("previews", "preview_id"),
+                ("applied_changes", "rollback_id"),
+                ("applied_changes", "preview_id"),
+            ):
+                db.execute(
+                    f"UPDATE {table} SET {column} = uuid_blob({column}) "
+                    f"WHERE typeof({column}) = 'text'"
+                )
+
+        if 2 <= version < 5:
+            # Version 5: previews record how new_content is stored and shown
+            # ('diff', 'full_replace' or 'append_delta'). Tables rebuilt
+            # above already have the column.
+            db.execute("ALTER TABLE previews ADD COLUMN kind TEXT NOT NULL DEFAULT 'diff'")
+
+    @staticmethod
+    def _preview_row(
+        note_id: str,
+        operation: str,
+        original_content: str,
+        new_content: Optional[str] = None,
+        target: Optional[str] = None,
+        expiry_minutes: int = 10,
+        kind: str = "diff",
+        append_delta: Optional[str] = None
+    ) -> tuple:
+        """Build the INSERT parameters for a new preview."""
+        if append_delta is not None:
+            # Only the appended text is stored; reads rebuild the rest
+            new_content, kind = append_delta, "append_delta"
+        elif new_content is None:
+            raise ValueError("Either new_content or append_delta is required")
+        preview_id = uuid.uuid4().bytes
+        expires_at = int(time.time()) + expiry_minutes * 60
+        return (preview_id, note_id, operation, target,
+                _compress(original_content), _compress(new_content), expires_at, kind)
 
     async def create_preview(
         self,
         note_id: str,
         operation: str,
         original_content: str,
-        new_content: str,
+        new_content: Optional[str] = None,
         target: Optional[str] = None,
-        expiry_minutes: int = 10
+        expiry_minutes: int = 10,
+        kind: str = "diff",
+        append_delta: Optional[str] = None
     ) -> str:
-        """Create a new preview record."""
-        preview_id = str(uuid.uuid4())
-        expires_at = datetime.now() + timedelta(minutes=expiry_minutes)
+        """Create a new preview record.
+
+        kind is 'full_replace' when the whole note is replaced, which the
+        preview page shows side by side instead of as a diff. For appends,
+        pass append_delta (the text added after original_content) instead
+        of new_content so the note isn't stored twice.
+        """
+        row = self._preview_row(
+            note_id, operation, original_content, new_content, target, expiry_minutes, kind,
+            append_delta
+        )
+
+        await self._write(lambda db: db.execute(_INSERT_PREVIEW_SQL, row))
+        return _id_str(row[0])
+
+    async def bulk_create_previews(self, previews: List[Dict[str, Any]]) -> List[str]:
+        """Create several previews in one transaction.
+        Each dict takes the same keyword arguments as create_preview."""
+        rows = [self._preview_row(**preview) for preview in previews]
 
-        await self.db.execute('''
-            INSERT INTO previews
-            (preview_id, note_id, operation, target, original_content, new_content, expires_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (preview_id, note_id, operation, target, original_content, new_content, expires_at))
+        def insert(db: sqlite3.Connection):
+            with _transaction(db):
+                db.executemany(_INSERT_PREVIEW_SQL, rows)
 
-        await self.db.commit()
-        return preview_id
+        await self._write(insert)
+        return [_id_str(row[0]) for row in rows]
 
     async def get_preview(self, preview_id: str) -> Optional[Dict[str, Any]]:
         """Get a preview by ID."""
-        cursor = await self.db.execute('''
-            SELECT preview_id, note_id, operation, target, original_content,
-                   new_content, status, created_at, expires_at
-            FROM previews
-            WHERE preview_id = ?
-        ''', (preview_id,))
-
-        row = await cursor.fetchone()
+        key = _id_bytes(preview_id)
+        cached = self._cache_get(self._preview_cache, key)
+        if cached:
+            return cached
+
+        generation = self._cache_generation
+        row = await self._read(
+            lambda db: db.execute(_SELECT_PREVIEW_SQL, (key,)).fetchone()
+        )
         if row:
-            return {
-                "preview_id": row[0],
-                "note_id": row[1],
-                "operation": row[2],
-                "target": row[3],
-                "original_content": row[4],
-                "new_content": row[5],
-                "status": row[6],
-                "created_at": row[7],
-                "expires_at": row[8]
-            }
+            preview = _preview_from_row(row)
+            self._cache_put(self._preview_cache, key, preview, generation)
+            return dict(preview)
         return None
 
+    async def get_preview_with_expiry(self, preview_id: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Get a preview and whether it has expired, in one round trip.
+
+        An expired preview is marked as such in the database, but returned
+        as it was read so callers can tell expiry apart from other statuses.
+        """
+        key = _id_bytes(preview_id)
+        cached = self._cache_get(self._preview_cache, key)
+        # Only pending previews can expire
+        if cached and cached["status"] != "pending":
+            return cached, False
+
+        generation = self._cache_generation
+        row = await self._read(
+            lambda db: db.execute(_SELECT_PREVIEW_EXPIRY_SQL, (key,)).fetchone()
+        )
+        if not row:
+            return None, False
+
+        preview = _preview_from_row(row)
+        expired = bool(preview.pop("expired"))
+        if expired:
+            await self.update_preview_status(preview_id, "expired")
+        else:
+            self._cache_put(self._preview_cache, key, preview, generation)
+            preview = dict(preview)
+        return preview, expired
+
     async def update_preview_status(self, preview_id: str, status: str) -> bool:
         """Update the status of a preview."""
-        await self.db.execute('''
-            UPDATE previews
-            SET status = ?
-            WHERE preview_id = ?
-        ''', (status, preview_id))
-
-        await self.db.commit()
-        cursor = await self.db.execute("SELECT changes()")
-        changes = await cursor.fetchone()
-        return changes[0] > 0
+        key = _id_bytes(preview_id)
+        # fetchall steps the statement to completion so the autocommit ends
+        rows = await self._write(
+            lambda db: db.execute(_UPDATE_STATUS_SQL, (status, key)).fetchall()
+        )
+        self._invalidate_caches(key)
+        return bool(rows)
 
     async def create_applied_change(
         self,
@@ -154,95 +643,118 @@ class Database:
         backup_note_id: Optional[str] = None
     ) -> str:
         """Record an applied change for rollback capability."""
-        rollback_id = str(uuid.uuid4())
+        rollback_id = uuid.uuid4().bytes
+        params = (
+            rollback_id, _id_bytes(preview_id), note_id, backup_note_id,
+            _compress(original_content), _content_title(original_content)
+        )
 
-        await self.db.execute('''
-            INSERT INTO applied_changes
-            (rollback_id, preview_id, note_id, backup_note_id, original_content)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (rollback_id, preview_id, note_id, backup_note_id, original_content))
+        await self._write(lambda db: db.execute(_INSERT_APPLIED_SQL, params))
+        return _id_str(rollback_id)
 
-        await self.db.commit()
-        return rollback_id
+    async def apply_preview(
+        self,
+        preview_id: str,
+        note_id: str,
+        original_content: str,
+        backup_note_id: Optional[str] = None
+    ) -> str:
+        """Record an applied change and mark its preview applied in one transaction.
+        Raises ValueError if the preview is no longer pending."""
+        rollback_id = uuid.uuid4().bytes
+        params = (
+            rollback_id, _id_bytes(preview_id), note_id, backup_note_id,
+            _compress(original_content), _content_title(original_content)
+        )
+
+        def apply(db: sqlite3.Connection):
+            with _transaction(db):
+                # Claim the preview first so a concurrent apply can't record twice
+                if db.execute(_MARK_APPLIED_SQL, (params[1],)).rowcount == 0:
+                    raise ValueError(f"Preview is no longer pending: {preview_id}")
+                db.execute(_INSERT_APPLIED_SQL, params)
+
+        await self._write(apply)
+        self._invalidate_caches(params[1])
+        return _id_str(rollback_id)
 
     async def get_rollback_data(self, rollback_id: str) -> Optional[Dict[str, Any]]:
         """Get rollback data by ID."""
-        cursor = await self.db.execute('''
-            SELECT rollback_id, preview_id, note_id, backup_note_id,
-                   original_content, applied_at
-            FROM applied_changes
-            WHERE rollback_id = ?
-        ''', (rollback_id,))
-
-        row = await cursor.fetchone()
+        key = _id_bytes(rollback_id)
+        cached = self._cache_get(self._rollback_cache, key)
+        if cached:
+            return cached
+
+        generation = self._cache_generation
+        row = await self._read(
+            lambda db: db.execute(_SELECT_ROLLBACK_SQL, (key,)).fetchone()
+        )
         if row:
-            return {
-                "rollback_id": row[0],
-                "preview_id": row[1],
-                "note_id": row[2],
-                "backup_note_id": row[3],
-                "original_content": row[4],
-                "applied_at": row[5]
-            }
+            rollback = dict(row)
+            rollback["rollback_id"] = _id_str(row["rollback_id"])
+            rollback["preview_id"] = _id_str(row["preview_id"])
+            rollback["original_content"] = _decompress(row["original_content"])
+            rollback["applied_at"] = _format_timestamp(row["applied_at"])
+            self._cache_put(self._rollback_cache, key, rollback, generation)
+            return dict(rollback)
         return None
 
     async def get_preview_status(self, preview_id: str) -> Optional[Dict[str, Any]]:
-        """Get the status of a preview with associated rollback info if applied."""
-        preview = await self.get_preview(preview_id)
-        if not preview:
+        """Get the status of a preview with associated rollback info if applied.
+        A pending preview past its expiry is marked and reported as expired."""
+        row = await self._read(
+            lambda db: db.execute(_PREVIEW_STATUS_SQL, (_id_bytes(preview_id),)).fetchone()
+        )
+        if not row:
             return None
 
         result = {
-            "status": preview["status"],
+            "status": row["status"],
             "preview_id": preview_id
         }
+        if row["expired"]:
+            await self.update_preview_status(preview_id, "expired")
+            result["status"] = "expired"
 
-        # If applied, get rollback information
-        if preview["status"] == "applied":
-            cursor = await self.db.execute('''
-                SELECT rollback_id, backup_note_id
-                FROM applied_changes
-                WHERE preview_id = ?
-            ''', (preview_id,))
-
-            row = await cursor.fetchone()
-            if row:
-                result["rollback_id"] = row[0]
-                result["backup_note_id"] = row[1]
+        # If applied, include rollback information
+        if row["status"] == "applied" and row["rollback_id"] is not None:
+            result["rollback_id"] = _id_str(row["rollback_id"])
+            result["backup_note_id"] = row["backup_note_id"]
 
         return result
 
     async def cleanup_expired(self):
         """Clean up expired previews older than 24 hours."""
-        cutoff = datetime.now() - timedelta(hours=24)
+        await self._write(self._cleanup_expired)
+        self._invalidate_caches()
 
-        await self.db.execute('''
-            DELETE FROM previews
-            WHERE expires_at < ? AND status = 'pending'
-        ''', (cutoff,))
+    def _cleanup_expired(self, db: sqlite3.Connection):
+        db.execute(_DELETE_EXPIRED_SQL, (_expired_cutoff(),))
 
-        await self.db.commit()
+    async def has_expired(self) -> bool:
+        """Check whether cleanup_expired has anything to delete.
+        Answered from the partial pending/expires_at index without a scan."""
+        row = await self._read(
+            lambda db: db.execute(_HAS_EXPIRED_SQL, (_expired_cutoff(),)).fetchone()
+        )
+        return row is not None
 
     async def cleanup_old_records(self):
         """Delete records older than retention period from both tables."""
-        cutoff = datetime.now() - timedelta(days=RETENTION_DAYS)
-        cutoff_str = cutoff.strftime("%Y-%m-%d %H:%M:%S")
+        def delete(db: sqlite3.Connection):
+            with _transaction(db):
+                self._cleanup_old_records(db)
 
-        # Delete old applied_changes first (due to foreign key reference)
-        cursor = await self.db.execute('''
-            DELETE FROM applied_changes
-            WHERE applied_at < ?
-        ''', (cutoff_str,))
-        applied_deleted = cursor.rowcount
+        await self._write(delete)
+        self._invalidate_caches()
 
-        # Delete old previews
-        cursor = await self.db.execute('''
-            DELETE FROM previews
-            WHERE created_at < ?
-        ''', (cutoff_str,))
-        previews_deleted = cursor.rowcount
+    def _cleanup_old_records(self, db: sqlite3.Connection):
+        cutoff = int(time.time()) - RETENTION_DAYS * 24 * 60 * 60
 
-        await self.db.commit()
+        # Delete old applied_changes first (due to foreign key reference)
+        applied_deleted = db.execute(_DELETE_OLD_APPLIED_SQL, (cutoff,)).rowcount
+        # Delete old previews no applied change still points to
+        previews_deleted = db.execute(_DELETE_OLD_PREVIEWS_SQL, (cutoff,)).rowcount
 
         if applied_deleted > 0 or previews_deleted > 0:
             logger.info(
@@ -252,75 +764,44 @@ class Database:
 
     async def is_preview_expired(self, preview_id: str) -> bool:
         """Check if a preview has expired."""
-        cursor = await self.db.execute('''
-            SELECT expires_at, status
-            FROM previews
-            WHERE preview_id = ?
-        ''', (preview_id,))
-
-        row = await cursor.fetchone()
-        if row:
-            expires_at = datetime.fromisoformat(row[0])
-            status = row[1]
-            if status == "pending" and expires_at < datetime.now():
-                # Mark as expired
-                await self.update_preview_status(preview_id, "expired")
-                return True
+        row = await self._read(
+            lambda db: db.execute(_IS_EXPIRED_SQL, (_id_bytes(preview_id),)).fetchone()
+        )
+        if row and row[0]:
+            # Mark as expired
+            await self.update_preview_status(preview_id, "expired")
+            return True
         return False
 
     async def get_recent_previews(self, note_id: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Get recent previews for a specific note."""
-        cursor = await self.db.execute('''
-            SELECT preview_id, operation, status, created_at
-            FROM previews
-            WHERE note_id = ?
-            ORDER BY created_at DESC
-            LIMIT ?
-        ''', (note_id, limit))
-
-        rows = await cursor.fetchall()
+        rows = await self._read(
+            lambda db: db.execute(_RECENT_PREVIEWS_SQL, (note_id, limit)).fetchall()
+        )
+        # sqlite3.Row is a mapping, so each dict is built in a single pass
         return [
             {
-                "preview_id": row[0],
-                "operation": row[1],
-                "status": row[2],
-                "created_at": row[3]
+                **row,
+                "preview_id": _id_str(row["preview_id"]),
+                "created_at": _format_timestamp(row["created_at"])
             }
             for row in rows
         ]
 
     async def get_all_applied_changes(self, limit: int = 50) -> List[Dict[str, Any]]:
         """Get all applied changes with preview details for history view."""
-        cursor = await self.db.execute('''
-            SELECT
-                ac.rollback_id,
-                ac.preview_id,
-                ac.note_id,
-                ac.applied_at,
-                p.operation,
-                p.target,
-                SUBSTR(ac.original_content, 1, 200) as content_preview
-            FROM applied_changes ac
-            JOIN previews p ON ac.preview_id = p.preview_id
-            ORDER BY ac.applied_at DESC
-            LIMIT ?
-        ''', (limit,))
-
-        rows = await cursor.fetchall()
-        results = []
-        for row in rows:
-            # Extract title from content preview
-            content_preview = row[6] or ""
-            lines = content_preview.split('\n')
-            title = lines[0].strip().lstrip('#').strip() if lines else "Untitled"
-
-            results.append({
-                "rollback_id": row[0],
-                "preview_id": row[1],
-                "note_id": row[2],
-                "applied_at": row[3],
-                "operation": row[4],
-                "target": row[5],
-                "note_title": title
-            })
-        return results
+        # Rows are converted on the reader thread as the cursor steps, so
+        # no intermediate list of rows is built and the event loop only
+        # receives the finished dicts. note_title is read as stored.
+        def history(db: sqlite3.Connection) -> List[Dict[str, Any]]:
+            return [
+                {
+                    **row,
+                    "rollback_id": _id_str(row["rollback_id"]),
+                    "preview_id": _id_str(row["preview_id"]),
+                    "applied_at": _format_timestamp(row["applied_at"])
+                }
+                for row in db.execute(_APPLIED_HISTORY_SQL, (limit,))
+            ]
+
+        return await self._read(history)
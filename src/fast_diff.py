@@ -0,0 +1,240 @@
+import difflib
+import logging
+from typing import Iterator, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Numba is optional; without it diffs come straight from difflib
+try:
+    import numpy as np
+    from numba import njit
+except ImportError:
+    np = None
+    njit = None
+
+# Edit distance beyond which the Myers trace gets too large to keep;
+# such diffs are left to difflib. The trace holds (d + 1)^2 int64s, so
+# this caps it at about 8 MB in the long-running server.
+MAX_EDIT_DISTANCE = 1000
+
+_EQUAL, _REPLACE, _DELETE, _INSERT = 0, 1, 2, 3
+_TAGS = ("equal", "replace", "delete", "insert")
+
+Opcode = Tuple[str, int, int, int, int]
+
+
+if njit is not None:
+    @njit(cache=True)
+    def myers_diff(a, b, max_d):
+        """Myers' O(ND) diff over two int64 arrays of line ids.
+
+        Returns (ops, ok): ops rows are (op, a_idx, b_idx) in order, with op
+        _EQUAL, _DELETE or _INSERT. ok is False when the edit distance
+        exceeds max_d.
+        """
+        n = a.shape[0]
+        m = b.shape[0]
+        offset = n + m + 1
+        v = np.zeros(2 * offset + 1, dtype=np.int64)
+        # V for each step d is saved as its [-d, d] slice at trace[d * d]
+        trace = np.empty(1024, dtype=np.int64)
+        depth = -1
+        for d in range(min(n + m, max_d) + 1):
+            for k in range(-d, d + 1, 2):
+                if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                    x = v[offset + k + 1]
+                else:
+                    x = v[offset + k - 1] + 1
+                y = x - k
+                while x < n and y < m and a[x] == b[y]:
+                    x += 1
+                    y += 1
+                v[offset + k] = x
+                if x >= n and y >= m:
+                    depth = d
+                    break
+            if depth >= 0:
+                break
+            needed = (d + 1) * (d + 1)
+            if needed > trace.shape[0]:
+                grown = np.empty(max(needed, 2 * trace.shape[0]), dtype=np.int64)
+                grown[:d * d] = trace[:d * d]
+                trace = grown
+            trace[d * d:needed] = v[offset - d:offset + d + 1]
+
+        ops = np.empty((n + m, 3), dtype=np.int32)
+        if depth < 0:
+            return ops[:0], False
+
+        # Walk the saved frontiers back from (n, m), emitting ops in reverse
+        count = 0
+        x = n
+        y = m
+        for d in range(depth, 0, -1):
+            prev = trace[(d - 1) * (d - 1):d * d]
+            k = x - y
+            if k == -d or (k != d and prev[k - 1 + d - 1] < prev[k + 1 + d - 1]):
+                prev_k = k + 1
+            else:
+                prev_k = k - 1
+            prev_x = prev[prev_k + d - 1]
+            prev_y = prev_x - prev_k
+            while x > prev_x and y > prev_y:
+                x -= 1
+                y -= 1
+                ops[count, 0] = _EQUAL
+                ops[count, 1] = x
+                ops[count, 2] = y
+                count += 1
+            if prev_k == k + 1:
+                ops[count, 0] = _INSERT
+            else:
+                ops[count, 0] = _DELETE
+            ops[count, 1] = prev_x
+            ops[count, 2] = prev_y
+            count += 1
+            x = prev_x
+            y = prev_y
+        while x > 0 and y > 0:
+            x -= 1
+            y -= 1
+            ops[count, 0] = _EQUAL
+            ops[count, 1] = x
+            ops[count, 2] = y
+            count += 1
+        return ops[:count][::-1], True
+
+    @njit(cache=True)
+    def _ops_to_opcodes(ops):
+        """Collapse an edit script into difflib-style (tag, i1, i2, j1, j2) rows."""
+        codes = np.empty((ops.shape[0] + 1, 5), dtype=np.int32)
+        count = 0
+        i = 0
+        j = 0
+        pos = 0
+        total = ops.shape[0]
+        while pos < total:
+            i1 = i
+            j1 = j
+            if ops[pos, 0] == _EQUAL:
+                while pos < total and ops[pos, 0] == _EQUAL:
+                    i += 1
+                    j += 1
+                    pos += 1
+                tag = _EQUAL
+            else:
+                while pos < total and ops[pos, 0] != _EQUAL:
+                    if ops[pos, 0] == _DELETE:
+                        i += 1
+                    else:
+                        j += 1
+                    pos += 1
+                if i > i1 and j > j1:
+                    tag = _REPLACE
+                elif i > i1:
+                    tag = _DELETE
+                else:
+                    tag = _INSERT
+            codes[count, 0] = tag
+            codes[count, 1] = i1
+            codes[count, 2] = i
+            codes[count, 3] = j1
+            codes[count, 4] = j
+            count += 1
+        return codes[:count]
+
+
+def _line_ids(a: Sequence[str], b: Sequence[str]):
+    """Map each distinct line to a small integer so the diff compares ints.
+    Unlike hashing this cannot collide."""
+    ids = {}
+    a_ids = np.fromiter((ids.setdefault(line, len(ids)) for line in a), dtype=np.int64, count=len(a))
+    b_ids = np.fromiter((ids.setdefault(line, len(ids)) for line in b), dtype=np.int64, count=len(b))
+    return a_ids, b_ids
+
+
+def _grouped_opcodes(codes: List[Opcode], n: int) -> Iterator[List[Opcode]]:
+    """Split opcodes into hunks with n lines of context, as difflib does."""
+    if not codes:
+        codes = [("equal", 0, 1, 0, 1)]
+    # Trim leading and trailing context to n lines
+    tag, i1, i2, j1, j2 = codes[0]
+    if tag == "equal":
+        codes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    tag, i1, i2, j1, j2 = codes[-1]
+    if tag == "equal":
+        codes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+
+    group = []
+    for tag, i1, i2, j1, j2 in codes:
+        # A long unchanged run ends one hunk and starts the next
+        if tag == "equal" and i2 - i1 > 2 * n:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        yield group
+
+
+def _format_range(start: int, stop: int) -> str:
+    """Format a hunk range the way unified diff headers expect."""
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return f"{beginning}"
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
+
+
+def unified_diff(
+    a: Sequence[str],
+    b: Sequence[str],
+    fromfile: str = "",
+    tofile: str = "",
+    n: int = 3,
+    lineterm: str = "\n"
+) -> Iterator[str]:
+    """Drop-in replacement for difflib.unified_diff.
+
+    Uses a Numba-compiled Myers diff when Numba is installed, falling back
+    to difflib otherwise or when the edit distance is very large.
+    """
+    if njit is None:
+        yield from difflib.unified_diff(a, b, fromfile, tofile, n=n, lineterm=lineterm)
+        return
+
+    a_ids, b_ids = _line_ids(a, b)
+    ops, ok = myers_diff(a_ids, b_ids, MAX_EDIT_DISTANCE)
+    if not ok:
+        logger.debug(f"Edit distance over {MAX_EDIT_DISTANCE} lines, using difflib")
+        yield from difflib.unified_diff(a, b, fromfile, tofile, n=n, lineterm=lineterm)
+        return
+
+    codes = [
+        (_TAGS[tag], i1, i2, j1, j2)
+        for tag, i1, i2, j1, j2 in _ops_to_opcodes(ops).tolist()
+    ]
+    started = False
+    for group in _grouped_opcodes(codes, n):
+        if not started:
+            started = True
+            yield f"--- {fromfile}{lineterm}"
+            yield f"+++ {tofile}{lineterm}"
+
+        first, last = group[0], group[-1]
+        yield f"@@ -{_format_range(first[1], last[2])} +{_format_range(first[3], last[4])} @@{lineterm}"
+
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                for line in a[i1:i2]:
+                    yield " " + line
+                continue
+            if tag in ("replace", "delete"):
+                for line in a[i1:i2]:
+                    yield "-" + line
+            if tag in ("replace", "insert"):
+                for line in b[j1:j2]:
+                    yield "+" + line
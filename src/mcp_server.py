@@ -1,17 +1,21 @@
 #!/usr/bin/env python3
 import asyncio
-import json
+import functools
 import logging
 import os
 import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 from typing import Any, Dict, Optional, List
 from pathlib import Path
 
+import anyio
+import orjson
 from mcp.server.fastmcp import FastMCP
 
-from bear_client import BearClient
-from database import Database
+from bear_client import BearClient, insert_line, replace_section_content
+from database import Database, READER_COUNT
 from web_server import WebServer
 
 # Configure logging to stderr to avoid interfering with MCP protocol on stdout
@@ -22,17 +26,66 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Read once; the web server binds this port for the lifetime of the process
+WEB_PORT = int(os.environ.get('BEAR_MCP_WEB_PORT', '8765'))
+PREVIEW_URL_PREFIX = f"http://localhost:{WEB_PORT}/preview/"
+# Read-only SQLite connections the database keeps open for the process
+DB_READERS = int(os.environ.get('BEAR_MCP_DB_READERS', str(READER_COUNT)))
+# Debug mode exposes diagnostic endpoints on the web server
+DEBUG = bool(os.environ.get('BEAR_MCP_DEBUG'))
+
+# Threads for blocking BearClient calls (note reads and x-callback URL
+# opens); they are short, so a small fixed pool is enough
+BEAR_IO_WORKERS = 2
+
+# bear_get_status messages, keyed by preview status
+_STATUS_MESSAGES = {
+    "applied": lambda d: (
+        f"Changes were applied. Use rollback_id '{d['rollback_id']}' to undo."
+        if "rollback_id" in d else "Changes were applied."
+    ),
+    "pending": lambda d: f"Preview pending. Visit {PREVIEW_URL_PREFIX}{d['preview_id']} to review.",
+    "rejected": lambda d: "Preview was rejected.",
+    "expired": lambda d: "Preview has expired.",
+}
+
+# How often the background task prunes expired and out-of-retention rows
+RETENTION_INTERVAL_SECONDS = 60 * 60
+
+
+def _dumps(data: Dict[str, Any]) -> str:
+    """Serialize a tool result as indented JSON."""
+    return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
+
 
 # Global objects for dependency injection
 class AppContext:
-    def __init__(self, db: Database, web_server: WebServer, bear_client: BearClient):
+    def __init__(self, db: Database, web_server: WebServer, bear_client: BearClient,
+                 bear_executor: ThreadPoolExecutor):
         self.db = db
         self.web_server = web_server
         self.bear_client = bear_client
+        self.bear_executor = bear_executor
 
 # Global context - will be set during lifespan
 app_context: Optional[AppContext] = None
 
+
+async def _retention_loop(db: Database):
+    """Periodically delete expired previews and records past retention.
+
+    The first pass runs right after startup so short-lived sessions still
+    prune old rows, without holding up the server coming up.
+    """
+    while True:
+        try:
+            if await db.has_expired():
+                await db.cleanup_expired()
+            await db.cleanup_old_records()
+        except Exception as e:
+            logger.error(f"Retention cleanup failed: {e}")
+        await asyncio.sleep(RETENTION_INTERVAL_SECONDS)
+
 @asynccontextmanager
 async def app_lifespan(server: FastMCP):
     """Manage application lifecycle - startup and cleanup."""
@@ -40,40 +93,107 @@ async def app_lifespan(server: FastMCP):
     
     print("Starting database connection...", file=sys.stderr, flush=True)
     # Connect to database
-    db = Database()
+    db = Database(readers=DB_READERS)
     await db.connect()
     print("Database connected successfully", file=sys.stderr, flush=True)
+    retention_task = asyncio.create_task(_retention_loop(db))
     
-    # Initialize Bear client
+    # Initialize Bear client and the threads its blocking calls run on
     bear_client = BearClient()
+    bear_executor = ThreadPoolExecutor(max_workers=BEAR_IO_WORKERS, thread_name_prefix="bear-io")
     
-    # Get web server port from environment
-    web_port = int(os.environ.get('BEAR_MCP_WEB_PORT', '8765'))
-    
-    print(f"Starting web server on port {web_port}...", file=sys.stderr, flush=True)
+    print(f"Starting web server on port {WEB_PORT}...", file=sys.stderr, flush=True)
     # Start web server
-    web_server = WebServer(db, bear_client, web_port)
+    web_server = WebServer(db, bear_client, WEB_PORT, bear_executor, debug=DEBUG)
     web_task = asyncio.create_task(web_server.start())
     print("Web server task created", file=sys.stderr, flush=True)
     
     # Set global context
-    app_context = AppContext(db, web_server, bear_client)
+    app_context = AppContext(db, web_server, bear_client, bear_executor)
     
     try:
         yield app_context
     finally:
         print("Cleaning up servers...", file=sys.stderr, flush=True)
-        # Cancel web server task
-        web_task.cancel()
-        try:
-            await web_task
-        except asyncio.CancelledError:
-            pass
+        # Cancel web server and retention tasks
+        for task in (web_task, retention_task):
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
         
         if web_server:
             await web_server.stop()
         if db:
             await db.close()
+        bear_executor.shutdown(wait=False)
+        bear_client.close()
+
+async def _run_bear(fn, *args, **kwargs):
+    """Run a blocking BearClient call on the Bear I/O threads."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        app_context.bear_executor, functools.partial(fn, *args, **kwargs)
+    )
+
+async def _render_diff(original_content: str, new_content: str) -> Optional[bytes]:
+    """Render a preview's diff HTML ahead of the first page view.
+
+    Only warms the page's cache, so a failure is logged and returns None;
+    the page renders the diff itself when it is first opened.
+    """
+    if not app_context.web_server:
+        return None
+    try:
+        return await asyncio.to_thread(
+            app_context.web_server.generate_diff_html, original_content, new_content
+        )
+    except Exception as e:
+        logger.warning(f"Could not pre-render preview diff: {e}")
+        return None
+
+def _append(original_content: str, content: str, target: Optional[str]) -> str:
+    return original_content + "\n" + content
+
+def _prepend(original_content: str, content: str, target: Optional[str]) -> str:
+    return content + "\n" + original_content
+
+def _replace(original_content: str, content: str, target: Optional[str]) -> str:
+    if not target:
+        # Replace entire content when no target
+        return content
+    # Replace specific text when target is provided
+    if target not in original_content:
+        raise ValueError(f"Target text '{target}' not found in note")
+    return original_content.replace(target, content)
+
+def _insert_at_line(original_content: str, content: str, target: Optional[str]) -> str:
+    if not target:
+        raise ValueError("Invalid operation or missing target parameter")
+    try:
+        line_num = int(target)
+    except ValueError:
+        raise ValueError("For insert_at_line, target must be a line number")
+    return insert_line(original_content, line_num, content)
+
+def _replace_section(original_content: str, content: str, target: Optional[str]) -> str:
+    if not target:
+        raise ValueError("Invalid operation or missing target parameter")
+    new_content = replace_section_content(original_content, target, content, first_match=True)
+    if new_content is None:
+        raise ValueError(f"Section '{target}' not found in note")
+    return new_content
+
+# bear_preview_update operations, keyed by name; each returns the new content
+_OPERATIONS = {
+    "append": _append,
+    "prepend": _prepend,
+    "replace": _replace,
+    "insert_at_line": _insert_at_line,
+    "replace_section": _replace_section,
+}
+VALID_OPERATIONS = tuple(_OPERATIONS)
 
 # Create FastMCP server with lifespan management
 mcp = FastMCP("bear-safe-update", lifespan=app_lifespan)
@@ -90,85 +210,59 @@ async def bear_preview_update(
         raise ValueError("Server not initialized")
     
     # Validate operation
-    valid_operations = ["append", "prepend", "replace", "insert_at_line", "replace_section"]
-    if operation not in valid_operations:
-        raise ValueError(f"Invalid operation. Must be one of: {', '.join(valid_operations)}")
+    if operation not in _OPERATIONS:
+        raise ValueError(f"Invalid operation. Must be one of: {', '.join(VALID_OPERATIONS)}")
     
-    # Read current note content
-    note_data = app_context.bear_client.read_note(note_id)
+    # Read current note content (a blocking SQLite read) off the event loop
+    note_data = await _run_bear(app_context.bear_client.read_note, note_id)
     if not note_data:
         raise ValueError(f"Could not read note with ID: {note_id}")
     
     original_content = note_data["content"]
     
     # Calculate new content based on operation
-    if operation == "append":
-        new_content = original_content + "\n" + content
-    elif operation == "prepend":
-        new_content = content + "\n" + original_content
-    elif operation == "replace":
-        if target:
-            # Replace specific text when target is provided
-            if target in original_content:
-                new_content = original_content.replace(target, content)
-            else:
-                raise ValueError(f"Target text '{target}' not found in note")
-        else:
-            # Replace entire content when no target
-            new_content = content
-    elif operation == "insert_at_line" and target:
-        try:
-            line_num = int(target)
-            lines = original_content.split('\n')
-            line_index = max(0, min(line_num - 1, len(lines)))
-            lines.insert(line_index, content)
-            new_content = '\n'.join(lines)
-        except ValueError:
-            raise ValueError("For insert_at_line, target must be a line number")
-    elif operation == "replace_section" and target:
-        # Find and replace section
-        lines = original_content.split('\n')
-        section_start = -1
-        section_end = len(lines)
-        
-        for i, line in enumerate(lines):
-            if target in line and line.strip().startswith('#'):
-                section_start = i
-                # Find section end
-                heading_level = len(line) - len(line.lstrip('#'))
-                for j in range(i + 1, len(lines)):
-                    if lines[j].strip().startswith('#'):
-                        current_level = len(lines[j]) - len(lines[j].lstrip('#'))
-                        if current_level <= heading_level:
-                            section_end = j
-                            break
-                break
-        
-        if section_start >= 0:
-            new_lines = lines[:section_start+1] + [content] + lines[section_end:]
-            new_content = '\n'.join(new_lines)
-        else:
-            raise ValueError(f"Section '{target}' not found in note")
-    else:
-        raise ValueError("Invalid operation or missing target parameter")
+    new_content = _OPERATIONS[operation](original_content, content, target)
+    
+    # A whole-note replace diffs every line against every other, so its
+    # preview shows the two versions side by side instead
+    kind = "full_replace" if operation == "replace" and not target else "diff"
     
     # Store preview in database
     if app_context.db:
-        preview_id = await app_context.db.create_preview(
+        if operation == "append":
+            # Store only the appended text alongside the original
+            content_args = {"append_delta": new_content[len(original_content):]}
+        else:
+            content_args = {"new_content": new_content}
+        create = app_context.db.create_preview(
             note_id=note_id,
             operation=operation,
             original_content=original_content,
-            new_content=new_content,
-            target=target
+            target=target,
+            kind=kind,
+            **content_args
         )
+        if kind == "full_replace":
+            preview_id = await create
+        else:
+            # Render the diff for the preview page while the write is in
+            # flight. The write is awaited directly so its error reaches the
+            # client as is; the render never raises (see _render_diff).
+            diff_task = asyncio.create_task(_render_diff(original_content, new_content))
+            try:
+                preview_id = await create
+            except BaseException:
+                diff_task.cancel()
+                raise
+            diff_html = await diff_task
+            if diff_html is not None:
+                app_context.web_server.cache_diff(preview_id, diff_html)
     else:
         # Fallback if database not initialized
-        import uuid
         preview_id = str(uuid.uuid4())
     
-    # Generate preview URL (get port from web server)
-    web_port = int(os.environ.get('BEAR_MCP_WEB_PORT', '8765'))
-    preview_url = f"http://localhost:{web_port}/preview/{preview_id}"
+    # Generate preview URL
+    preview_url = PREVIEW_URL_PREFIX + preview_id
     
     result = {
         "preview_url": preview_url,  # Put URL first to emphasize it
@@ -179,7 +273,7 @@ async def bear_preview_update(
         "preview_id": preview_id  # Keep ID last as it's less important
     }
     
-    return json.dumps(result, indent=2)
+    return _dumps(result)
 
 @mcp.tool()
 async def bear_get_status(preview_id: str) -> str:
@@ -190,31 +284,18 @@ async def bear_get_status(preview_id: str) -> str:
     if not app_context.db:
         raise ValueError("Database not initialized")
     
-    # Check if preview exists and get status
+    # Check if preview exists and get status (expired previews included)
     status_data = await app_context.db.get_preview_status(preview_id)
     
     if not status_data:
         raise ValueError(f"Preview not found: {preview_id}")
     
-    # Check if expired
-    if await app_context.db.is_preview_expired(preview_id):
-        status_data["status"] = "expired"
-    
     # Add helpful message based on status
-    web_port = int(os.environ.get('BEAR_MCP_WEB_PORT', '8765'))
-    if status_data["status"] == "applied":
-        if "rollback_id" in status_data:
-            status_data["message"] = f"Changes were applied. Use rollback_id '{status_data['rollback_id']}' to undo."
-        else:
-            status_data["message"] = "Changes were applied."
-    elif status_data["status"] == "pending":
-        status_data["message"] = f"Preview pending. Visit http://localhost:{web_port}/preview/{preview_id} to review."
-    elif status_data["status"] == "rejected":
-        status_data["message"] = "Preview was rejected."
-    elif status_data["status"] == "expired":
-        status_data["message"] = "Preview has expired."
+    format_message = _STATUS_MESSAGES.get(status_data["status"])
+    if format_message:
+        status_data["message"] = format_message(status_data)
     
-    return json.dumps(status_data, indent=2)
+    return _dumps(status_data)
 
 @mcp.tool()
 async def bear_rollback_change(rollback_id: str) -> str:
@@ -232,7 +313,8 @@ async def bear_rollback_change(rollback_id: str) -> str:
         raise ValueError(f"Rollback not found: {rollback_id}")
     
     # Restore original content
-    success = app_context.bear_client.update_note(
+    success = await _run_bear(
+        app_context.bear_client.update_note,
         note_id=rollback_data["note_id"],
         content=rollback_data["original_content"],
         mode="replace"
@@ -245,10 +327,18 @@ async def bear_rollback_change(rollback_id: str) -> str:
             "note_id": rollback_data["note_id"],
             "backup_note_id": rollback_data["backup_note_id"]
         }
-        return json.dumps(result, indent=2)
+        return _dumps(result)
     else:
         raise ValueError("Failed to rollback changes")
 
 # Entry point for FastMCP
 if __name__ == "__main__":
-    mcp.run()
\ No newline at end of file
+    # The MCP server and the preview web server share one event loop, so
+    # uvloop has to be chosen here rather than in uvicorn's config. This is
+    # mcp.run() for the stdio transport, with the loop choice passed to anyio.
+    try:
+        import uvloop  # noqa: F401
+        use_uvloop = True
+    except ImportError:
+        use_uvloop = False
+    anyio.run(mcp.run_stdio_async, backend_options={"use_uvloop": use_uvloop})
@@ -1,33 +1,61 @@
 import asyncio
+import functools
 import logging
+from collections import OrderedDict
+from concurrent.futures import Executor
 from pathlib import Path
-from datetime import datetime
-import difflib
-from typing import Optional
+from typing import Iterator, Optional
 
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache
 import uvicorn
 
+from fast_diff import unified_diff
+
 logger = logging.getLogger(__name__)
 
+# Rendered diffs kept per preview; a preview's content never changes
+DIFF_CACHE_SIZE = 256
+# Template output events gathered into each chunk of a streamed page
+STREAM_BUFFER_SIZE = 64
+
 
 class WebServer:
     """Web server for preview UI and API endpoints."""
+
+    # Diff line CSS classes keyed by the unified-diff prefix character
+    _DIFF_LINE_CLASSES = {
+        '+': 'diff-add',
+        '-': 'diff-remove',
+        '@': 'diff-info',
+    }
     
-    def __init__(self, database, bear_client, port: int = 8765):
+    def __init__(self, database, bear_client, port: int = 8765,
+                 bear_executor: Optional[Executor] = None, debug: bool = False):
         self.db = database
         self.bear_client = bear_client
         self.port = port
+        # Blocking BearClient calls run here; None means the loop's default executor
+        self.bear_executor = bear_executor
+        # Diagnostic endpoints are only served in debug mode
+        self.debug = debug
         self.app = FastAPI(title="Bear MCP Preview")
         self.server = None
+        self._diff_cache: OrderedDict[str, bytes] = OrderedDict()
         
         # Setup templates
         template_dir = Path(__file__).parent / "templates"
         template_dir.mkdir(exist_ok=True)
         self.templates = Jinja2Templates(directory=str(template_dir))
+        # Templates ship with the server: skip the per-render mtime check and
+        # reuse compiled bytecode across restarts. The default cache
+        # directory is per-user with 0700 permissions, so other local users
+        # can't plant bytecode in it.
+        self.templates.env.auto_reload = False
+        self.templates.env.bytecode_cache = FileSystemBytecodeCache()
         
         # Register routes
         self._register_routes()
@@ -47,32 +75,42 @@ class WebServer:
         async def preview_page(request: Request, preview_id: str):
             """Display preview page with diff."""
             try:
-                # Get preview data
-                preview = await self.db.get_preview(preview_id)
+                # Get preview data along with its expiry in one query
+                preview, expired = await self.db.get_preview_with_expiry(preview_id)
                 if not preview:
                     raise HTTPException(status_code=404, detail="Preview not found")
                 
                 logger.info(f"Preview {preview_id} has status: {preview['status']}")
                 
+                # Whole-note replacements are shown side by side, not diffed
+                full_replace = preview["kind"] == "full_replace"
+                
                 # For applied changes, show read-only view
                 if preview["status"] == "applied":
                     logger.info(f"Showing historical view for applied preview: {preview_id}")
-                    # Generate diff for historical view
-                    diff_html = self._generate_diff_html(
-                        preview["original_content"],
-                        preview["new_content"]
-                    )
+                    # Applied is terminal, so the diff is rendered only once
+                    diff_html = b"" if full_replace else self._cached_diff(preview_id)
+                    if diff_html is None:
+                        # Render off the event loop so other requests aren't blocked
+                        diff_html = await asyncio.to_thread(
+                            self.generate_diff_html,
+                            preview["original_content"],
+                            preview["new_content"]
+                        )
+                        self.cache_diff(preview_id, diff_html)
                     
                     title = self.bear_client._extract_title(preview["original_content"])
                     
-                    return self.templates.TemplateResponse(
+                    # The diff is ready, so render in full and send with a
+                    # Content-Length rather than chunked
+                    return self._render_template(
                         "preview.html",
                         {
-                            "request": request,
                             "preview_id": preview_id,
                             "note_title": title,
                             "operation": preview["operation"],
-                            "diff_html": diff_html,
+                            "diff_chunks": (diff_html.decode(),),
+                            "full_replace": full_replace,
                             "original_content": preview["original_content"],
                             "new_content": preview["new_content"],
                             "readonly": True,  # Flag to hide action buttons
@@ -81,7 +119,7 @@ class WebServer:
                     )
                 
                 # Check if preview expired
-                if await self.db.is_preview_expired(preview_id):
+                if expired:
                     return self.templates.TemplateResponse(
                         "error.html",
                         {
@@ -102,23 +140,34 @@ class WebServer:
                         }
                     )
                 
-                # Generate diff for pending preview
-                diff_html = self._generate_diff_html(
-                    preview["original_content"],
-                    preview["new_content"]
-                )
+                # Use the diff rendered when the preview was created if it is
+                # still cached and send the page whole; otherwise render lines
+                # lazily as the page streams
+                diff_html = self._cached_diff(preview_id)
+                if full_replace:
+                    diff_chunks = ()
+                    respond = self._render_template
+                elif diff_html is not None:
+                    diff_chunks = (diff_html.decode(),)
+                    respond = self._render_template
+                else:
+                    diff_chunks = self._iter_diff_html(
+                        preview["original_content"],
+                        preview["new_content"]
+                    )
+                    respond = self._stream_template
                 
                 # Extract title from content
                 title = self.bear_client._extract_title(preview["original_content"])
                 
-                return self.templates.TemplateResponse(
+                return respond(
                     "preview.html",
                     {
-                        "request": request,
                         "preview_id": preview_id,
                         "note_title": title,
                         "operation": preview["operation"],
-                        "diff_html": diff_html,
+                        "diff_chunks": diff_chunks,
+                        "full_replace": full_replace,
                         "original_content": preview["original_content"],
                         "new_content": preview["new_content"],
                         "readonly": False,  # This is an active preview
@@ -143,8 +192,8 @@ class WebServer:
         async def apply_changes(preview_id: str):
             """Apply the preview changes to Bear."""
             try:
-                # Get preview
-                preview = await self.db.get_preview(preview_id)
+                # Get preview along with its expiry in one query
+                preview, expired = await self.db.get_preview_with_expiry(preview_id)
                 if not preview:
                     raise HTTPException(status_code=404, detail="Preview not found")
                 
@@ -156,11 +205,12 @@ class WebServer:
                     )
                 
                 # Check expiration
-                if await self.db.is_preview_expired(preview_id):
+                if expired:
                     raise HTTPException(status_code=400, detail="Preview has expired")
                 
                 # Apply changes (backup is stored in database, not as a Bear note)
-                success = self.bear_client.update_note(
+                success = await self._run_bear(
+                    self.bear_client.update_note,
                     note_id=preview["note_id"],
                     content=preview["new_content"],
                     mode="replace"
@@ -169,18 +219,20 @@ class WebServer:
                 if not success:
                     raise HTTPException(status_code=500, detail="Failed to update note")
                 
-                # Record applied change (no backup_note_id since we don't create Bear notes)
-                rollback_id = await self.db.create_applied_change(
-                    preview_id=preview_id,
-                    note_id=preview["note_id"],
-                    original_content=preview["original_content"],
-                    backup_note_id=None  # No Bear backup note created
-                )
-                
-                # Update preview status
-                await self.db.update_preview_status(preview_id, "applied")
+                # Record applied change and mark the preview applied
+                # (no backup_note_id since we don't create Bear notes)
+                try:
+                    rollback_id = await self.db.apply_preview(
+                        preview_id=preview_id,
+                        note_id=preview["note_id"],
+                        original_content=preview["original_content"],
+                        backup_note_id=None  # No Bear backup note created
+                    )
+                except ValueError as e:
+                    # Another request applied or rejected it in the meantime
+                    raise HTTPException(status_code=400, detail=str(e))
                 
-                return JSONResponse({
+                return ORJSONResponse({
                     "success": True,
                     "message": "Changes applied successfully. Backup stored in database.",
                     "rollback_id": rollback_id
@@ -202,7 +254,7 @@ class WebServer:
                 if not success:
                     raise HTTPException(status_code=404, detail="Preview not found")
                 
-                return JSONResponse({
+                return ORJSONResponse({
                     "success": True,
                     "message": "Changes rejected"
                 })
@@ -215,16 +267,13 @@ class WebServer:
         async def get_status(preview_id: str):
             """Get the current status of a preview."""
             try:
+                # Reports expired previews as such
                 status = await self.db.get_preview_status(preview_id)
                 
                 if not status:
                     raise HTTPException(status_code=404, detail="Preview not found")
                 
-                # Check expiration
-                if await self.db.is_preview_expired(preview_id):
-                    status["status"] = "expired"
-                
-                return JSONResponse(status)
+                return ORJSONResponse(status)
                 
             except HTTPException:
                 raise
@@ -232,6 +281,12 @@ class WebServer:
                 logger.error(f"Error getting status: {e}", exc_info=True)
                 raise HTTPException(status_code=500, detail=str(e))
         
+        if self.debug:
+            @self.app.get("/debug/pool")
+            async def pool_status():
+                """Report database reader pool usage."""
+                return ORJSONResponse(self.db.pool_stats())
+        
         @self.app.get("/history", response_class=HTMLResponse)
         async def history_page(request: Request):
             """Display history of all applied changes."""
@@ -270,7 +325,8 @@ class WebServer:
                     raise HTTPException(status_code=404, detail="Backup not found")
                 
                 # Restore the original content
-                success = self.bear_client.update_note(
+                success = await self._run_bear(
+                    self.bear_client.update_note,
                     note_id=rollback_data["note_id"],
                     content=rollback_data["original_content"],
                     mode="replace"
@@ -279,7 +335,7 @@ class WebServer:
                 if not success:
                     raise HTTPException(status_code=500, detail="Failed to restore note")
                 
-                return JSONResponse({
+                return ORJSONResponse({
                     "success": True,
                     "message": "Note restored successfully",
                     "note_id": rollback_data["note_id"]
@@ -291,12 +347,55 @@ class WebServer:
                 logger.error(f"Error restoring backup: {e}", exc_info=True)
                 raise HTTPException(status_code=500, detail=str(e))
     
-    def _generate_diff_html(self, original: str, new: str) -> str:
-        """Generate HTML diff visualization."""
+    async def _run_bear(self, fn, *args, **kwargs):
+        """Run a blocking BearClient call on the Bear executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.bear_executor, functools.partial(fn, *args, **kwargs)
+        )
+    
+    def _render_template(self, name: str, context: dict) -> HTMLResponse:
+        """Render a template in full; the response carries a Content-Length."""
+        return HTMLResponse(self.templates.get_template(name).render(context))
+    
+    def _stream_template(self, name: str, context: dict) -> StreamingResponse:
+        """Render a template as a streamed response instead of one string."""
+        stream = self.templates.get_template(name).stream(context)
+        stream.enable_buffering(STREAM_BUFFER_SIZE)
+        return StreamingResponse(stream, media_type="text/html")
+    
+    def cache_diff(self, preview_id: str, diff_html: bytes):
+        """Remember the rendered diff for a preview, evicting the oldest when full."""
+        self._diff_cache[preview_id] = diff_html
+        self._diff_cache.move_to_end(preview_id)
+        if len(self._diff_cache) > DIFF_CACHE_SIZE:
+            self._diff_cache.popitem(last=False)
+    
+    def _cached_diff(self, preview_id: str) -> Optional[bytes]:
+        """Return a cached rendered diff, marking it recently used."""
+        diff_html = self._diff_cache.get(preview_id)
+        if diff_html is not None:
+            self._diff_cache.move_to_end(preview_id)
+        return diff_html
+    
+    def generate_diff_html(self, original: str, new: str) -> bytes:
+        """Generate HTML diff visualization as UTF-8.
+
+        Lines are appended to one buffer rather than joined from a list, and
+        UTF-8 keeps cached diffs compact: one emoji would otherwise widen
+        every character of the str to four bytes.
+        """
+        buf = bytearray()
+        for line in self._iter_diff_html(original, new):
+            buf += line.encode()
+        return bytes(buf)
+    
+    def _iter_diff_html(self, original: str, new: str) -> Iterator[str]:
+        """Yield the HTML diff visualization one line at a time."""
         original_lines = original.splitlines(keepends=True)
         new_lines = new.splitlines(keepends=True)
         
-        diff = difflib.unified_diff(
+        diff = unified_diff(
             original_lines,
             new_lines,
             fromfile="Original",
@@ -304,20 +403,13 @@ class WebServer:
             lineterm=""
         )
         
-        html_lines = []
         for line in diff:
-            if line.startswith('+++') or line.startswith('---'):
-                html_lines.append(f'<div class="diff-header">{self._escape_html(line)}</div>')
-            elif line.startswith('+'):
-                html_lines.append(f'<div class="diff-add">{self._escape_html(line)}</div>')
-            elif line.startswith('-'):
-                html_lines.append(f'<div class="diff-remove">{self._escape_html(line)}</div>')
-            elif line.startswith('@'):
-                html_lines.append(f'<div class="diff-info">{self._escape_html(line)}</div>')
-            else:
-                html_lines.append(f'<div class="diff-context">{self._escape_html(line)}</div>')
-        
-        return '\n'.join(html_lines)
+            # One dict lookup on the first character; only +/- lines can
+            # be the ---/+++ file headers
+            css_class = self._DIFF_LINE_CLASSES.get(line[:1], 'diff-context')
+            if line[:3] in ('+++', '---'):
+                css_class = 'diff-header'
+            yield f'<div class="{css_class}">{self._escape_html(line)}</div>\n'
     
     def _escape_html(self, text: str) -> str:
         """Escape HTML special characters."""
@@ -362,6 +454,10 @@ class WebServer:
                 app=self.app,
                 host="0.0.0.0",
                 port=self.port,
+                # The C httptools parser when installed, else pure-Python h11.
+                # serve() runs on the MCP server's loop, so uvicorn's loop
+                # option would have no effect; uvloop is set up at startup
+                http="auto",
                 log_level="critical",  # Only log critical errors
                 access_log=False,  # Disable access logs
                 use_colors=False,  # Disable colored output
@@ -6,95 +6,153 @@ Run this directly without starting the MCP server:
 """
 
 import asyncio
+import logging
+import os
+import statistics
 import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
+from queue import SimpleQueue
 
-# Add src to path so we can import our modules
-sys.path.insert(0, str(Path(__file__).parent / "src"))
+# Add src to path so we can import our modules; BEAR_MCP_SRC points the
+# tests at another checkout
+_SRC = os.environ.get("BEAR_MCP_SRC") or os.fspath(Path(__file__).with_name("src"))
+if _SRC not in sys.path:
+    sys.path.insert(0, _SRC)
 
 from bear_client import BearClient
 from database import Database
 
 
+_BAR = "=" * 60
+
+# Test output goes through this logger; main() hands its records to a
+# background thread that writes them to stdout, so tests don't block on it
+log = logging.getLogger("bear-test")
+log.setLevel(logging.INFO)
+log.propagate = False
+
+# Wall-clock nanoseconds per test phase, one entry per run
+_TIMINGS = defaultdict(list)
+
+
 def print_section(title):
     """Print a formatted section header."""
-    print(f"\n{'='*60}")
-    print(f"  {title}")
-    print('='*60)
+    log.info(f"\n{_BAR}\n  {title}\n{_BAR}")
+
+
+@contextmanager
+def timed(name):
+    """Record how long the enclosed block takes under name in _TIMINGS."""
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        _TIMINGS[name].append(time.perf_counter_ns() - start)
+
+
+async def _timed_test(name, coro):
+    """Await a test coroutine, timing it under name."""
+    with timed(name):
+        return await coro
 
 
-def test_bear_client():
+def print_timings():
+    """Print median and p95 time per phase, in microseconds."""
+    print_section("Timings")
+    log.info(f"   {'phase':<12}{'runs':>6}{'median µs':>14}{'p95 µs':>14}")
+    for name, samples in _TIMINGS.items():
+        ordered = sorted(samples)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        log.info(f"   {name:<12}{len(ordered):>6}"
+                 f"{statistics.median(ordered) / 1000:>14.0f}{p95 / 1000:>14.0f}")
+
+
+def test_bear_client(client):
     """Test Bear client functionality."""
-    client = BearClient()
-    
     print_section("Bear Client Test")
     
     # Check if Bear database exists
     if not client.db_path.exists():
-        print(f"❌ Bear database not found at: {client.db_path}")
-        print("   Make sure Bear is installed and has been run at least once.")
+        log.info(f"❌ Bear database not found at: {client.db_path}")
+        log.info("   Make sure Bear is installed and has been run at least once.")
         return False
     
-    print(f"✅ Bear database found at: {client.db_path}")
+    log.info(f"✅ Bear database found at: {client.db_path}")
     
     # Test 1: Search for notes
     print_section("Test 1: Search for Notes")
-    print("Searching for notes containing 'test'...")
+    log.info("Searching for notes containing 'test'...")
     
-    search_results = client.search_notes("test")
+    # Fetch content with the results so reading the top note needs no
+    # second query
+    search_results = client.search_notes("test", include_content=True)
     
     if search_results:
-        print(f"✅ Found {len(search_results)} notes:")
-        for i, note in enumerate(search_results[:3], 1):  # Show first 3
-            print(f"   {i}. {note['title']} (ID: {note['id'][:8]}...)")
-            print(f"      Preview: {note['preview'][:50]}...")
+        log.info(f"✅ Found {len(search_results)} notes:")
+        # Show first 3, written out in one go
+        log.info("\n".join(
+            f"   {i}. {note['title']} (ID: {note['id'][:8]}...)\n"
+            f"      Preview: {note['preview'][:50]}..."
+            for i, note in enumerate(search_results[:3], 1)
+        ))
     else:
-        print("⚠️  No notes found containing 'test'")
-        print("   Searching for any notes...")
-        search_results = client.search_notes("")
+        log.info("⚠️  No notes found containing 'test'")
+        log.info("   Searching for any notes...")
+        search_results = client.search_notes("", include_content=True)
         if search_results:
-            print(f"✅ Found {len(search_results)} notes in Bear")
-            for i, note in enumerate(search_results[:3], 1):
-                print(f"   {i}. {note['title']} (ID: {note['id'][:8]}...)")
+            log.info(f"✅ Found {len(search_results)} notes in Bear")
+            log.info("\n".join(
+                f"   {i}. {note['title']} (ID: {note['id'][:8]}...)"
+                for i, note in enumerate(search_results[:3], 1)
+            ))
     
     # Test 2: Read a specific note
     if search_results:
         print_section("Test 2: Read a Specific Note")
         test_note_id = search_results[0]['id']
-        print(f"Reading note with ID: {test_note_id}")
+        log.info(f"Reading note with ID: {test_note_id}")
         
-        note_data = client.read_note(test_note_id)
+        # Read through the shared read-only connection and note cache
+        with timed("read_note"):
+            note_data = client.read_note(test_note_id)
         
         if note_data:
-            print(f"✅ Successfully read note:")
-            print(f"   Title: {note_data['title']}")
-            print(f"   ID: {note_data['id']}")
-            print(f"   Trashed: {note_data['trashed']}")
-            print(f"   Content length: {len(note_data['content'])} characters")
-            print(f"   Content preview:")
+            log.info(f"✅ Successfully read note:")
+            log.info(f"   Title: {note_data['title']}")
+            log.info(f"   ID: {note_data['id']}")
+            log.info(f"   Trashed: {note_data['trashed']}")
+            if note_data['content'] != search_results[0]['content']:
+                log.info("❌ Content differs from the search result's prefetched content")
+            log.info(f"   Content length: {len(note_data['content'])} characters")
+            log.info(f"   Content preview:")
             content_preview = note_data['content'][:200].replace('\n', '\n      ')
-            print(f"      {content_preview}...")
+            log.info(f"      {content_preview}...")
             
             return note_data
         else:
-            print(f"❌ Could not read note with ID: {test_note_id}")
+            log.info(f"❌ Could not read note with ID: {test_note_id}")
     
     return None
 
 
-async def test_database():
+async def test_database(db):
     """Test database functionality."""
     print_section("Database Test")
     
-    db = Database()
-    
     try:
-        await db.connect()
-        print("✅ Database connected successfully")
-        print(f"   Database path: {db.db_path}")
+        # Readers rely on WAL to avoid blocking behind the writer
+        journal_mode = await db.journal_mode()
+        if journal_mode != "wal":
+            log.info(f"❌ Expected WAL journal mode, got: {journal_mode}")
+            return False
+        log.info(f"✅ Journal mode: {journal_mode}")
         
         # Test creating a preview
-        print("\n📝 Creating test preview...")
+        log.info("\n📝 Creating test preview...")
         preview_id = await db.create_preview(
             note_id="TEST-NOTE-ID",
             operation="append",
@@ -104,101 +162,139 @@ async def test_database():
             expiry_minutes=10
         )
         
-        print(f"✅ Preview created with ID: {preview_id}")
+        log.info(f"✅ Preview created with ID: {preview_id}")
         
         # Test retrieving the preview
         preview = await db.get_preview(preview_id)
         if preview:
-            print(f"✅ Preview retrieved successfully")
-            print(f"   Status: {preview['status']}")
-            print(f"   Operation: {preview['operation']}")
-        
-        await db.close()
-        print("✅ Database closed successfully")
+            log.info(f"✅ Preview retrieved successfully")
+            log.info(f"   Status: {preview['status']}")
+            log.info(f"   Operation: {preview['operation']}")
         
     except Exception as e:
-        print(f"❌ Database error: {e}")
+        log.info(f"❌ Database error: {e}")
         return False
     
     return True
 
 
-async def test_preview_workflow():
-    """Test the complete preview workflow."""
-    print_section("Preview Workflow Test")
-    
-    client = BearClient()
-    
-    # First, find a note to test with
-    search_results = client.search_notes("")
-    if not search_results:
-        print("❌ No notes found in Bear to test with")
-        return
-    
-    test_note_id = search_results[0]['id']
-    test_note_title = search_results[0]['title']
+async def test_preview_workflow(db, note_data):
+    """Test the complete preview workflow.
     
-    print(f"Using note: {test_note_title} (ID: {test_note_id[:8]}...)")
+    Uses the note test_bear_client already loaded, content included,
+    instead of searching for and reading it again.
+    """
+    print_section("Preview Workflow Test")
     
-    # Read the note
-    note_data = client.read_note(test_note_id)
-    if not note_data:
-        print(f"❌ Could not read note")
-        return
+    test_note_id = note_data['id']
+    test_note_title = note_data['title']
     
-    print(f"✅ Read note successfully")
-    print(f"   Original content length: {len(note_data['content'])} characters")
+    log.info(f"Using note: {test_note_title} (ID: {test_note_id[:8]}...)")
+    log.info(f"   Original content length: {len(note_data['content'])} characters")
     
     # Simulate creating a preview
-    db = Database()
-    await db.connect()
-    
     test_content = "\n\n### Test Section\nThis is a test addition from the Bear MCP test script."
-    new_content = note_data['content'] + test_content
-    
-    preview_id = await db.create_preview(
-        note_id=test_note_id,
-        operation="append",
-        original_content=note_data['content'],
-        new_content=new_content,
-        target=None
+    
+    # Create an append and a prepend preview in a single transaction
+    preview_ids = await db.bulk_create_previews([
+        {
+            "note_id": test_note_id,
+            "operation": "append",
+            "original_content": note_data['content'],
+            "append_delta": test_content
+        },
+        {
+            "note_id": test_note_id,
+            "operation": "prepend",
+            "original_content": note_data['content'],
+            "new_content": test_content.strip() + "\n\n" + note_data['content']
+        }
+    ])
+    
+    # Check the statuses concurrently; each read borrows its own connection
+    # from the database's reader pool
+    statuses = await asyncio.gather(
+        *(db.get_preview_status(preview_id) for preview_id in preview_ids)
     )
     
-    print(f"✅ Created preview: {preview_id}")
-    print(f"   Preview URL would be: http://localhost:8765/preview/{preview_id}")
+    for preview_id, status in zip(preview_ids, statuses):
+        log.info(f"✅ Created preview: {preview_id}")
+        log.info(f"   Preview URL would be: http://localhost:8765/preview/{preview_id}")
+        log.info(f"✅ Preview status: {status}")
     
-    # Check preview status
-    status = await db.get_preview_status(preview_id)
-    print(f"✅ Preview status: {status}")
+    log.info("\n⚠️  Note: Actual note update skipped (test mode)")
+    log.info("   In production, this would update the note via x-callback-url")
+
+
+async def _run_async_tests(note_data):
+    """Run the database and workflow tests concurrently on one event loop.
     
-    await db.close()
+    Both share one Database, connected once; like the server, it serves
+    concurrent tasks from its own writer and reader pool. Returns the
+    database test's result.
+    """
+    db = Database()
+    try:
+        await db.connect()
+        log.info("✅ Database connected successfully")
+        log.info(f"   Database path: {db.db_path}")
+    except Exception as e:
+        log.info(f"❌ Database error: {e}")
+        return False
     
-    print("\n⚠️  Note: Actual note update skipped (test mode)")
-    print("   In production, this would update the note via x-callback-url")
+    try:
+        if not note_data:
+            return await _timed_test("database", test_database(db))
+        db_success, _ = await asyncio.gather(
+            _timed_test("database", test_database(db)),
+            _timed_test("workflow", test_preview_workflow(db, note_data))
+        )
+        return db_success
+    finally:
+        await db.close()
+        log.info("✅ Database closed successfully")
 
 
 def main():
     """Main test function."""
-    print("\n" + "="*60)
-    print("  BEAR MCP CLIENT TEST SUITE")
-    print("="*60)
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(logging.Formatter("%(message)s"))
+    records = SimpleQueue()
+    queue_handler = QueueHandler(records)
+    log.addHandler(queue_handler)
+    listener = QueueListener(records, output)
+    listener.start()
+    try:
+        _run_tests()
+    finally:
+        # Flushes everything queued before any error is reported
+        listener.stop()
+        log.removeHandler(queue_handler)
+
+
+def _run_tests():
+    """Run each test phase in turn."""
+    print_section("BEAR MCP CLIENT TEST SUITE")
     
-    # Test 1: Bear Client
-    note_data = test_bear_client()
+    # One client for every test, so Bear's database is located once
+    client = BearClient()
     
-    # Test 2: Database
-    print("\nRunning async database tests...")
-    db_success = asyncio.run(test_database())
+    # Test 1: Bear Client
+    with timed("bear"):
+        note_data = test_bear_client(client)
     
-    # Test 3: Preview Workflow (if we have a note)
+    # Tests 2 and 3: Database and Preview Workflow (if we have a note)
+    log.info("\nRunning async database tests...")
     if note_data:
-        print("\nRunning preview workflow test...")
-        asyncio.run(test_preview_workflow())
+        log.info("Running preview workflow test...")
+    db_success = asyncio.run(_run_async_tests(note_data))
     
     print_section("Test Summary")
-    print("✅ All tests completed!")
-    print("\nNote: This test script reads from Bear's database and creates")
-    print("test previews, but does NOT modify any actual Bear notes.")
+    log.info("✅ All tests completed!")
+    log.info("\nNote: This test script reads from Bear's database and creates")
+    log.info("test previews, but does NOT modify any actual Bear notes.")
+    
+    print_timings()
 
 
 if __name__ == "__main__":